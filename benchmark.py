@@ -0,0 +1,176 @@
+import argparse
+import json
+import math
+import os
+import random
+import string
+import tempfile
+import time
+from datetime import datetime,timedelta
+# offline replay benchmarks: everything runs on CPU against local files, no camera or browser needed
+def percentile(values,p):
+    if not values:return 0.0
+    values=sorted(values)
+    return values[max(0,math.ceil(p/100*len(values))-1)] # nearest rank
+def summarize(samples):
+    ms=[v*1000 for v in samples]
+    return {"count":len(ms),"mean_ms":sum(ms)/len(ms) if ms else 0.0,"p50_ms":percentile(ms,50),"p95_ms":percentile(ms,95),"p99_ms":percentile(ms,99)}
+def print_table(title,rows):
+    print(f"\n{title}")
+    print(f"{'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for name,s in rows.items():print(f"{name:<16}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+def random_plate():
+    return "".join(random.choices(string.ascii_uppercase,k=2))+f"{random.randint(1,99):02d}"+"".join(random.choices(string.ascii_uppercase,k=2))+f"{random.randint(0,9999):04d}"
+# frames from a recorded clip, or a synthetic street scene with plate-like boxes drifting across it
+def frame_source(video,count,size):
+    import cv2
+    import numpy as np
+    if video:
+        cap=cv2.VideoCapture(video)
+        n=0
+        while cap.isOpened() and (not count or n<count):
+            ret,frame=cap.read()
+            if not ret:break
+            n+=1
+            yield frame
+        cap.release()
+        return
+    w,h=size
+    rng=np.random.default_rng(0)
+    base=np.tile(np.linspace(60,160,w,dtype=np.uint8),(h,1))
+    base=cv2.cvtColor(base,cv2.COLOR_GRAY2BGR)
+    plates=[random_plate() for _ in range(3)]
+    for i in range(count):
+        frame=base.copy()
+        for k,plate in enumerate(plates):
+            x=int((i*(4+k)+k*w//3)%max(w-260,1))
+            y=h//2+k*60-60
+            cv2.rectangle(frame,(x,y),(x+240,y+140),(40+k*60,40,120),-1)
+            cv2.rectangle(frame,(x+40,y+95),(x+200,y+130),(255,255,255),-1)
+            cv2.putText(frame,plate,(x+45,y+122),cv2.FONT_HERSHEY_SIMPLEX,0.55,(0,0,0),2)
+        frame=cv2.add(frame,rng.integers(0,12,frame.shape,dtype=np.uint8))
+        yield frame
+def bench_detector(args):
+    import detector as det
+    samples={"track":[],"clahe":[],"ocr":[]}
+    det.stage_hook=lambda stage,dt:samples.setdefault(stage,[]).append(dt) # list.append is atomic, ocr threads can call in
+    det.configure(args.backend,args.precision,args.imgsz,args.ocr_backend,args.device)
+    det.load_models()
+    size=tuple(int(v) for v in args.size.split("x"))
+    processed=set()
+    frames=list(frame_source(args.video,args.frames,size))
+    if not frames:raise SystemExit("no frames to replay")
+    for frame in frames[:args.warmup]:det.detect_frame(frame,processed)
+    det.ocr_pool.wait()
+    for v in samples.values():v.clear()
+    det.ocr_pool=det.OcrPool() # fresh counters and votes for the measured run
+    processed=set()
+    frame_times=[]
+    plates=0
+    t_start=time.perf_counter()
+    for frame in frames[args.warmup:]:
+        t0=time.perf_counter()
+        _,data=det.detect_frame(frame,processed)
+        frame_times.append(time.perf_counter()-t0)
+        if data:
+            processed.add(data['track_id'])
+            plates+=1
+    det.ocr_pool.wait() # ocr still in flight counts towards the run
+    wall=time.perf_counter()-t_start
+    det.stage_hook=None
+    n=len(frame_times)
+    rows={"detect_frame":summarize(frame_times)}
+    rows.update({k:summarize(v) for k,v in samples.items()})
+    report={"kind":"detector","backend":"{backend}/{precision}/{imgsz}/ocr-{ocr_backend}".format(**det.model_status()),"fallback":det.model_status()["fallback"],"device":det.device,"frames":n,"wall_s":wall,"fps":n/wall if wall else 0.0,"ocr_calls":det.ocr_pool.submitted,
+            "ocr_calls_per_frame":det.ocr_pool.submitted/n if n else 0.0,"plates":plates,"skipped_crops":det.ocr_pool.rejects,"stages":rows}
+    print_table(f"Detector replay: {n} frames from {args.video or 'synthetic '+args.size} in {wall:.2f}s -> {report['fps']:.1f} FPS",rows)
+    print(f"OCR calls: {report['ocr_calls']} ({report['ocr_calls_per_frame']:.2f}/frame) | plates accepted: {plates} | skipped crops: {report['skipped_crops']}")
+    return report
+def bench_db(args):
+    import database as db
+    workdir=tempfile.mkdtemp(prefix="parking_bench_")
+    db.DB_NAME=os.path.join(workdir,"bench.db")
+    db.init_db()
+    cfg=db.get_config()
+    db.update_config(cfg[1],10**6,10**6,cfg[4],cfg[5],cfg[6]) # capacity is not what we are measuring
+    if args.history:
+        # pre-populate a database of the requested size straight through sql
+        start=datetime.now()-timedelta(days=365)
+        rows=[]
+        for i in range(args.history):
+            entry=start+timedelta(seconds=i*365*86400//args.history)
+            rows.append((random_plate(),random.choice(["car","bike"]),entry.strftime("%Y-%m-%d %H:%M:%S"),(entry+timedelta(minutes=90)).strftime("%Y-%m-%d %H:%M:%S"),90.0,40.0,None))
+        with db.transaction() as c:c.executemany("INSERT INTO transaction_history(plate_number,vehicle_type,entry_time,exit_time,duration_min,total_fee,image_path) VALUES(?,?,?,?,?,?,?)",rows)
+        db.rebuild_rollups()
+    if args.watchlist:db.add_special_plates([(random_plate(),"Blacklist","bench") for _ in range(args.watchlist)])
+    plates=[random_plate() for _ in range(args.plates)]
+    events=[(random.choice(plates),random.choice(["car","bike"]),None,"Auto") for _ in range(args.events)]
+    handle,reads,lookups=[],[],[]
+    interval=1.0/args.rate if args.rate else 0
+    next_t=time.perf_counter()
+    t_start=time.perf_counter()
+    if args.batch:
+        for i in range(0,len(events),args.batch):
+            t0=time.perf_counter()
+            db.handle_vehicles(events[i:i+args.batch])
+            handle.append(time.perf_counter()-t0)
+            if interval: # a batch stands for batch events worth of arrivals
+                next_t+=interval*len(events[i:i+args.batch])
+                delay=next_t-time.perf_counter()
+                if delay>0:time.sleep(delay)
+    else:
+        for ev in events:
+            t0=time.perf_counter()
+            db.match_special_plate(ev[0],category='Blacklist')
+            lookups.append(time.perf_counter()-t0)
+            t0=time.perf_counter()
+            db.handle_vehicle(*ev)
+            handle.append(time.perf_counter()-t0)
+            # what the dashboard re-reads after every event
+            t0=time.perf_counter()
+            db.get_free_spots('car');db.get_free_spots('bike');db.get_today_revenue()
+            reads.append(time.perf_counter()-t0)
+            if interval:
+                next_t+=interval
+                delay=next_t-time.perf_counter()
+                if delay>0:time.sleep(delay)
+    wall=time.perf_counter()-t_start
+    rows={("handle_vehicles" if args.batch else "handle_vehicle"):summarize(handle)}
+    if lookups:rows["watchlist_match"]=summarize(lookups)
+    if reads:rows["metrics_read"]=summarize(reads)
+    report={"kind":"db","events":len(events),"history_rows":args.history,"watchlist":args.watchlist,"wall_s":wall,"events_per_s":len(events)/wall if wall else 0.0,"stages":rows}
+    print_table(f"Database: {len(events)} events over {args.history} history rows in {wall:.2f}s -> {report['events_per_s']:.0f} events/s",rows)
+    db.close_all()
+    if not args.keep:
+        for f in os.listdir(workdir):os.remove(os.path.join(workdir,f))
+        os.rmdir(workdir)
+    else:print(f"database kept at {db.DB_NAME}")
+    return report
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Offline throughput benchmarks for the detector and the database")
+    common=argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json",help="also write the report to this file, handy for comparing releases")
+    sub=parser.add_subparsers(dest="kind",required=True)
+    p_det=sub.add_parser("detector",parents=[common],help="replay frames through detector.detect_frame")
+    p_det.add_argument("--video",help="recorded clip to replay (default: synthetic frames)")
+    p_det.add_argument("--frames",type=int,default=300,help="frames to replay (0 = whole clip)")
+    p_det.add_argument("--size",default="1280x720",help="synthetic frame size WxH")
+    p_det.add_argument("--warmup",type=int,default=5)
+    p_det.add_argument("--backend",choices=["torch","onnx","openvino"])
+    p_det.add_argument("--precision",choices=["fp32","int8"])
+    p_det.add_argument("--imgsz",type=int)
+    p_det.add_argument("--ocr-backend",choices=["torch","onnx"])
+    p_det.add_argument("--device",default="cpu",help="torch device for YOLO and EasyOCR, e.g. cuda:0 (default cpu, so results compare across hosts)")
+    p_db=sub.add_parser("db",parents=[common],help="drive database.handle_vehicle with a synthetic entry/exit stream")
+    p_db.add_argument("--events",type=int,default=2000)
+    p_db.add_argument("--rate",type=float,default=0,help="events per second (0 = as fast as possible)")
+    p_db.add_argument("--history",type=int,default=0,help="rows of past history to pre-populate")
+    p_db.add_argument("--watchlist",type=int,default=0,help="special plates to pre-populate")
+    p_db.add_argument("--plates",type=int,default=500,help="distinct plates in the stream, fewer means more exits")
+    p_db.add_argument("--batch",type=int,default=0,help="ingest through handle_vehicles in batches of this size")
+    p_db.add_argument("--keep",action="store_true",help="keep the temporary database")
+    args=parser.parse_args(argv)
+    report=bench_detector(args) if args.kind=="detector" else bench_db(args)
+    if args.json:
+        with open(args.json,"w") as f:json.dump(report,f,indent=2)
+if __name__=="__main__":main()
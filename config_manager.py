@@ -1,6 +1,5 @@
 import streamlit as st
 import database as db
-import os
 import time
 def render_sidebar_status(placeholder):
     with placeholder.container():
@@ -52,14 +51,29 @@ def render_config_page():
             time.sleep(1)
             st.rerun() 
     st.markdown("---")
+    st.subheader("Inference")
+    inf=db.get_detector_config()
+    with st.form("inference_form"):
+        c1,c2=st.columns(2)
+        backends=["torch","onnx","openvino"]
+        with c1:
+            new_backend=st.selectbox("Detector Backend",backends,index=backends.index(inf["backend"]),help="ONNX Runtime / OpenVINO are much faster on CPU-only gates, exported on first use")
+            new_precision=st.selectbox("Precision",["fp32","int8"],index=["fp32","int8"].index(inf["precision"]),help="int8 is quantized, ignored by the torch backend")
+        with c2:
+            new_imgsz=st.select_slider("Input Resolution",options=[320,416,480,512,640,800,960],value=inf["imgsz"])
+            new_ocr=st.selectbox("OCR Backend",["torch","onnx"],index=["torch","onnx"].index(inf["ocr_backend"]))
+        if st.form_submit_button("Save Inference Settings"):
+            db.update_detector_config(new_backend,new_precision,new_imgsz,new_ocr)
+            st.success("Inference settings saved! Running gate workers pick them up on restart.")
+            time.sleep(1)
+            st.rerun()
+    st.markdown("---")
     st.subheader("Danger Zone")
     st.warning("Resetting the database will delete all history and active logs.")
     if st.button("FACTORY RESET DATABASE"):
-        try:
-            os.remove("parking.db")
-            st.success("Database deleted.")
-        except:pass
-        db.init_db()
+        # tables are recreated in place, running gate workers keep writing to the same database
+        db.reset_db()
+        st.success("All records deleted.")
         st.success("New Database created! System is fresh.")
         time.sleep(1.5)
         st.rerun()
\ No newline at end of file
@@ -1,107 +1,258 @@
 import sqlite3
+import threading
+import weakref
+import os
+from contextlib import contextmanager
 from datetime import datetime
 import math
+import csv
+import json
+from plate_index import PlateIndex
+import metrics
 DB_NAME="parking.db"
+_local=threading.local()
+_conns=weakref.WeakSet() # live per-thread connections, an entry goes away with its thread
+_conns_lock=threading.Lock()
+_generation=0 # bumped by close_all so every thread reconnects on its next call
+# occupancy counters and the config row kept in memory, rebuilt whenever another connection has committed
+_cache={"config":None,"occupancy":None}
+_cache_lock=threading.RLock()
+FUZZY_MAX_DIST=1 # edits allowed on top of OCR look-alike swaps when matching the watchlist
+_plates={"index":None,"version":None,"builder":None} # special_plates loaded for the frame path, keyed by special_plates_meta.version
+PLATE_DELTA_MAX=1000 # watchlist edits applied row by row, more than this and the index is rebuilt off the lock
+PLATE_LOG_KEEP=5000 # change log rows kept, a process further behind than this rebuilds
+# owns a thread's connection and closes it once the thread's locals are dropped, streamlit starts a new
+# script thread on every rerun so anything holding the connections strongly would leak two fds per rerun
+class _ThreadConn:
+    __slots__=("conn","__weakref__")
+    def __init__(self,conn):self.conn=conn
+    def close(self):
+        try:self.conn.close()
+        except sqlite3.Error:pass
+    def __del__(self):self.close()
+# one long lived connection per thread, sqlite keeps its prepared statement cache on the connection
+def get_conn():
+    conn=getattr(_local,"conn",None)
+    if conn is None or _local.generation!=_generation or _local.db_name!=DB_NAME:
+        # autocommit mode, writes go through transaction() so we control BEGIN IMMEDIATE ourselves
+        conn=sqlite3.connect(DB_NAME,timeout=10,isolation_level=None,check_same_thread=False,cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # safe with WAL, skips an fsync per commit
+        _local.owner=_ThreadConn(conn)
+        _local.conn,_local.generation,_local.db_name,_local.depth,_local.after_commit=conn,_generation,DB_NAME,0,[]
+        _local.data_version=None
+        with _conns_lock:_conns.add(_local.owner)
+    return conn
+@contextmanager
+def transaction():
+    conn=get_conn()
+    if _local.depth: # nested call, the outermost block owns the commit
+        _local.depth+=1
+        try:yield conn
+        finally:_local.depth-=1
+        return
+    # IMMEDIATE takes the write lock up front so a capacity check and its insert can't interleave with another gate
+    conn.execute("BEGIN IMMEDIATE")
+    _local.depth=1
+    try:
+        yield conn
+        # cache write-through happens under the cache lock together with the commit, so a reader
+        # rebuilding from the db can never count the same write twice
+        with _cache_lock:
+            conn.execute("COMMIT")
+            for fn in _local.after_commit:fn()
+    except BaseException:
+        if conn.in_transaction:conn.execute("ROLLBACK")
+        raise
+    finally:
+        _local.depth=0
+        _local.after_commit=[]
+# queue a cache update for when the surrounding transaction commits, dropped on rollback
+def _after_commit(fn):_local.after_commit.append(fn)
+def _load_cache(conn):
+    # PRAGMA data_version only moves when some *other* connection commits, our own writes are applied write-through
+    version=conn.execute("PRAGMA data_version").fetchone()[0]
+    with _cache_lock:
+        if _cache["occupancy"] is not None and _local.data_version==version:return _cache
+        _cache["config"]=conn.execute("SELECT * FROM parking_config").fetchone()
+        _cache["occupancy"]=dict(conn.execute("SELECT vehicle_type,count(*) FROM active_parking GROUP BY vehicle_type").fetchall())
+        _local.data_version=version
+        return _cache
+def _bump_occupancy(v_type,delta):
+    occ=_cache["occupancy"]
+    if occ is not None:occ[v_type]=occ.get(v_type,0)+delta
+def invalidate_cache():
+    with _cache_lock:
+        _cache["config"],_cache["occupancy"]=None,None
+        _plates["index"],_plates["version"]=None,None
+def _plates_version(conn):return conn.execute("SELECT version FROM special_plates_meta WHERE id=1").fetchone()[0]
+def _plate_index():
+    conn=get_conn()
+    version=_plates_version(conn) # read before the rows, a change slipping in between is simply applied again next call
+    index,have=_plates["index"],_plates["version"]
+    if index is not None and have==version:return index
+    if index is not None and have is not None and have<version:
+        logged=conn.execute("SELECT count(DISTINCT version) FROM special_plates_log WHERE version>? AND version<=?",(have,version)).fetchone()[0]
+        if logged==version-have and version-have<=PLATE_DELTA_MAX:
+            changed=conn.execute("SELECT l.plate_text,p.category,p.note FROM (SELECT DISTINCT plate_text FROM special_plates_log WHERE version>?) l LEFT JOIN special_plates p ON p.plate_text=l.plate_text",(have,)).fetchall()
+            # a handful of rows, cheap enough to apply under the lock every commit also takes
+            with _cache_lock:
+                if _plates["index"] is index and _plates["version"]==have:
+                    for plate,category,note in changed:
+                        if category is None:index.remove(plate)
+                        else:index.add(plate,category,note)
+                    _plates["version"]=version
+                return _plates["index"]
+    if index is None:return _build_plate_index(conn,version,None)
+    # bulk import, rollback, reset or a log pruned past us: rebuild on a background thread and keep serving the
+    # old index meanwhile, so neither the frame path nor a write transaction waits for it
+    with _cache_lock:
+        if _plates["builder"] is None or not _plates["builder"].is_alive():
+            _plates["builder"]=threading.Thread(target=lambda:_build_plate_index(get_conn(),_plates_version(get_conn()),index),name="plate-index",daemon=True)
+            _plates["builder"].start()
+    return index
+# full build without holding _cache_lock, then a quick swap unless the index moved on meanwhile
+def _build_plate_index(conn,version,replaces):
+    fresh=PlateIndex(FUZZY_MAX_DIST)
+    for plate,category,note in conn.execute("SELECT plate_text,category,note FROM special_plates"):fresh.add(plate,category,note)
+    with _cache_lock:
+        if _plates["index"] is replaces:_plates["index"],_plates["version"]=fresh,version
+        return _plates["index"]
+def close_all():
+    global _generation
+    with _conns_lock:
+        for owner in list(_conns):owner.close()
+        _conns.clear()
+        _generation+=1
+# drops and recreates every table in one transaction instead of deleting the file, gate workers keep their
+# pooled connections open and would otherwise go on writing to the unlinked file (or block the delete on Windows)
+def reset_db():
+    with transaction() as c:
+        version=c.execute("SELECT version FROM special_plates_meta WHERE id=1").fetchone() if c.execute("SELECT 1 FROM sqlite_master WHERE name='special_plates_meta'").fetchone() else None
+        for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():c.execute(f'DROP TABLE IF EXISTS "{name}"')
+        init_db()
+        # keep the watchlist version moving forward, another process could otherwise match it against its stale index
+        if version:c.execute("UPDATE special_plates_meta SET version=? WHERE id=1",(version[0]+1,))
+    invalidate_cache()
 def init_db():
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("PRAGMA journal_mode=WAL")  
-    c.execute('''CREATE TABLE IF NOT EXISTS parking_config(id INTEGER PRIMARY KEY,total_floors INTEGER,car_slots INTEGER,bike_slots INTEGER,car_rate REAL,bike_rate REAL,wiggle_min INTEGER)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS active_parking(id INTEGER PRIMARY KEY,plate_number TEXT UNIQUE,vehicle_type TEXT,entry_time TEXT,image_path TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS transaction_history(id INTEGER PRIMARY KEY,plate_number TEXT,vehicle_type TEXT,entry_time TEXT,exit_time TEXT,duration_min REAL,total_fee REAL,image_path TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS special_plates(plate_text TEXT PRIMARY KEY,category TEXT,note TEXT)''')
-    c.execute("SELECT count(*) FROM parking_config")
-    if c.fetchone()[0]==0:
-        c.execute("INSERT INTO parking_config VALUES(1,2,16,10,20.0,10.0,5)")
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute('''CREATE TABLE IF NOT EXISTS parking_config(id INTEGER PRIMARY KEY,total_floors INTEGER,car_slots INTEGER,bike_slots INTEGER,car_rate REAL,bike_rate REAL,wiggle_min INTEGER)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS active_parking(id INTEGER PRIMARY KEY,plate_number TEXT UNIQUE,vehicle_type TEXT,entry_time TEXT,image_path TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS transaction_history(id INTEGER PRIMARY KEY,plate_number TEXT,vehicle_type TEXT,entry_time TEXT,exit_time TEXT,duration_min REAL,total_fee REAL,image_path TEXT)''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_history_plate ON transaction_history(plate_number)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_history_entry ON transaction_history(entry_time)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_history_exit ON transaction_history(exit_time)")
+        # rollups kept up to date inside handle_vehicle, so analytics never scan the history table
+        c.execute('''CREATE TABLE IF NOT EXISTS hourly_stats(hour TEXT,vehicle_type TEXT,entries INTEGER DEFAULT 0,exits INTEGER DEFAULT 0,revenue REAL DEFAULT 0,PRIMARY KEY(hour,vehicle_type))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_stats(day TEXT,vehicle_type TEXT,entries INTEGER DEFAULT 0,exits INTEGER DEFAULT 0,revenue REAL DEFAULT 0,PRIMARY KEY(day,vehicle_type))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS special_plates(plate_text TEXT PRIMARY KEY,category TEXT,note TEXT)''')
+        # version counter bumped by triggers, lets every process notice a watchlist change with one tiny read
+        c.execute('''CREATE TABLE IF NOT EXISTS special_plates_meta(id INTEGER PRIMARY KEY CHECK(id=1),version INTEGER)''')
+        c.execute("INSERT OR IGNORE INTO special_plates_meta VALUES(1,0)")
+        # change log written by the same triggers, so another process catches up by applying only the rows that changed
+        c.execute("CREATE TABLE IF NOT EXISTS special_plates_log(id INTEGER PRIMARY KEY,version INTEGER,plate_text TEXT)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_plates_log_version ON special_plates_log(version)")
+        for op,changed in [("INSERT",["NEW"]),("UPDATE",["NEW","OLD"]),("DELETE",["OLD"])]:
+            log=" UNION ".join(f"SELECT version,{row}.plate_text FROM special_plates_meta WHERE id=1" for row in changed)
+            c.execute(f"DROP TRIGGER IF EXISTS special_plates_{op.lower()}") # databases from before the log get the new body
+            c.execute(f"CREATE TRIGGER special_plates_{op.lower()} AFTER {op} ON special_plates BEGIN UPDATE special_plates_meta SET version=version+1 WHERE id=1; "
+                      f"INSERT INTO special_plates_log(version,plate_text) {log}; "
+                      f"DELETE FROM special_plates_log WHERE version<=(SELECT version FROM special_plates_meta WHERE id=1)-{PLATE_LOG_KEEP}; END")
+        if c.execute("SELECT count(*) FROM parking_config").fetchone()[0]==0:
+            c.execute("INSERT INTO parking_config VALUES(1,2,16,10,20.0,10.0,5)")
+        # event feed and heartbeats written by headless gate workers, read by the dashboard
+        c.execute('''CREATE TABLE IF NOT EXISTS gate_events(id INTEGER PRIMARY KEY,ts TEXT,gate TEXT,status TEXT,plate_number TEXT,message TEXT,fee REAL,duration_min REAL,is_vip INTEGER)''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_gate_events_gate ON gate_events(gate,id)") # per gate feed for the dashboard
+        c.execute('''CREATE TABLE IF NOT EXISTS gate_status(gate TEXT PRIMARY KEY,gate_mode TEXT,source TEXT,pid INTEGER,started TEXT,heartbeat TEXT,stats TEXT)''')
+        # inference backend shared by the dashboard and every gate worker
+        c.execute('''CREATE TABLE IF NOT EXISTS detector_config(id INTEGER PRIMARY KEY CHECK(id=1),backend TEXT,precision TEXT,imgsz INTEGER,ocr_backend TEXT)''')
+        c.execute("INSERT OR IGNORE INTO detector_config VALUES(1,'torch','fp32',640,'torch')")
+        # databases from before the rollups existed get backfilled once
+        has_rollups=c.execute("SELECT EXISTS(SELECT 1 FROM hourly_stats)").fetchone()[0]
+        has_traffic=c.execute("SELECT EXISTS(SELECT 1 FROM transaction_history) OR EXISTS(SELECT 1 FROM active_parking)").fetchone()[0]
+        if has_traffic and not has_rollups:rebuild_rollups()
+    invalidate_cache()
+    _load_cache(get_conn())
+    _plate_index() # the one full build happens at start up, not on the first frame
+@metrics.timed("db_call_seconds",fn="get_config")
 def get_config():
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT * FROM parking_config")
-    cfg=c.fetchone()
-    conn.close()
-    return cfg
+    return _load_cache(get_conn())["config"]
+@metrics.timed("db_call_seconds",fn="update_config")
 def update_config(floors,cars,bikes,c_rate,b_rate,wiggle):
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("UPDATE parking_config SET total_floors=?,car_slots=?,bike_slots=?,car_rate=?,bike_rate=?,wiggle_min=? WHERE id=1",(floors,cars,bikes,c_rate,b_rate,wiggle))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("UPDATE parking_config SET total_floors=?,car_slots=?,bike_slots=?,car_rate=?,bike_rate=?,wiggle_min=? WHERE id=1",(floors,cars,bikes,c_rate,b_rate,wiggle))
+        new_cfg=c.execute("SELECT * FROM parking_config").fetchone()
+        _after_commit(lambda:_cache.__setitem__("config",new_cfg))
+@metrics.timed("db_call_seconds",fn="get_free_spots")
 def get_free_spots(v_type):
-    cfg=get_config()
+    conn=get_conn()
+    cache=_load_cache(conn)
+    cfg=cache["config"]
     limit=cfg[2] if v_type=='car' else cfg[3]
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT count(*) FROM active_parking WHERE vehicle_type=?",(v_type,))
-    occupied=c.fetchone()[0]
-    conn.close()
+    # inside a batch with uncommitted writes the counters lag behind, so ask the table itself
+    if _local.after_commit:occupied=conn.execute("SELECT count(*) FROM active_parking WHERE vehicle_type=?",(v_type,)).fetchone()[0]
+    else:occupied=cache["occupancy"].get(v_type,0)
     return occupied,limit
+@metrics.timed("db_call_seconds",fn="get_special_plate")
 def get_special_plate(plate_text):
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT category,note FROM special_plates WHERE plate_text=?",(plate_text,))
-    res=c.fetchone()
-    conn.close()
-    return res
+    return _plate_index().get(plate_text)
+# fuzzy watchlist lookup for the frame path, returns (listed plate,category,note,distance) or None
+@metrics.timed("db_call_seconds",fn="match_special_plate")
+def match_special_plate(plate_text,category=None,max_dist=None):
+    return _plate_index().match(plate_text,max_dist,category)
 def add_special_plate(plate,category,note):
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("REPLACE INTO special_plates (plate_text,category,note) VALUES(?,?,?)",(plate,category,note))
-    conn.commit()
-    conn.close()
+    add_special_plates([(plate,category,note)])
+# bulk import (e.g. a police watchlist feed) in one transaction
+@metrics.timed("db_call_seconds",fn="add_special_plates")
+def add_special_plates(rows):
+    rows=[(plate,category,note) for plate,category,note in rows]
+    with transaction() as c:
+        c.executemany("REPLACE INTO special_plates (plate_text,category,note) VALUES(?,?,?)",rows)
+@metrics.timed("db_call_seconds",fn="remove_special_plate")
 def remove_special_plate(plate):
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("DELETE FROM special_plates WHERE plate_text=?",(plate,))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("DELETE FROM special_plates WHERE plate_text=?",(plate,))
+@metrics.timed("db_call_seconds",fn="get_all_special_plates")
 def get_all_special_plates():
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT * FROM special_plates")
-    res=c.fetchall()
-    conn.close()
-    return res
+    return get_conn().execute("SELECT * FROM special_plates").fetchall()
 # newly upgraded handle_vehicle with gate enforcement (Entry/Exit/Auto)
+# the whole lookup -> capacity check -> write runs in one IMMEDIATE transaction, so two gates can't both take the last spot
+@metrics.timed("db_call_seconds",fn="handle_vehicle")
 def handle_vehicle(plate_text,v_type,img_path=None,gate_mode="Auto"):
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT * FROM active_parking WHERE plate_number=?",(plate_text,))
-    existing=c.fetchone()
-    special=get_special_plate(plate_text)
-    is_vip=special and special[0]=='VIP'
-    # Gate restriction logic - prevents exit gate from logging an entry and vice versa
-    if gate_mode=="Entry" and existing:
-        conn.close()
-        return "Error",f"{plate_text} already inside!",None
-    if gate_mode=="Exit" and not existing:
-        conn.close()
-        return "Error",f"{plate_text} not found in DB!",None
-    if existing and gate_mode in ["Exit","Auto"]:
-        entry_time_str=existing[3]
-        entry_img=existing[4]
-        entry_time=datetime.strptime(entry_time_str,"%Y-%m-%d %H:%M:%S")
-        total_fee,duration,exit_time=calculate_fee(entry_time,v_type)
-        if is_vip:total_fee=0.0 
-        c.execute("DELETE FROM active_parking WHERE plate_number=?",(plate_text,))
-        c.execute("INSERT INTO transaction_history(plate_number,vehicle_type,entry_time,exit_time,duration_min,total_fee,image_path) VALUES(?,?,?,?,?,?,?)",(plate_text,v_type,entry_time_str,exit_time.strftime("%Y-%m-%d %H:%M:%S"),duration,total_fee,entry_img))
-        conn.commit()
-        conn.close()
-        return "Exit","Vehicle Exited",{"fee":total_fee,"time":duration,"is_vip":is_vip}
-    elif not existing and gate_mode in ["Entry","Auto"]:
-        occupied,limit=get_free_spots(v_type)
-        if occupied>=limit:
-            conn.close()
-            return "Error",f"No {v_type} spots available!",None
-        entry_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        c.execute("INSERT INTO active_parking(plate_number,vehicle_type,entry_time,image_path) VALUES(?,?,?,?)",(plate_text,v_type,entry_time,img_path))
-        conn.commit()
-        conn.close()
-        return "Entry","Vehicle Entered",{"is_vip":is_vip}
-    else:
-        conn.close()
-        return "Error","Invalid gate operation",None
+    with transaction() as c:
+        existing=c.execute("SELECT * FROM active_parking WHERE plate_number=?",(plate_text,)).fetchone()
+        special=get_special_plate(plate_text)
+        is_vip=special and special[0]=='VIP'
+        # Gate restriction logic - prevents exit gate from logging an entry and vice versa
+        if gate_mode=="Entry" and existing:return "Error",f"{plate_text} already inside!",None
+        if gate_mode=="Exit" and not existing:return "Error",f"{plate_text} not found in DB!",None
+        if existing and gate_mode in ["Exit","Auto"]:
+            entry_time_str=existing[3]
+            entry_img=existing[4]
+            entry_time=datetime.strptime(entry_time_str,"%Y-%m-%d %H:%M:%S")
+            total_fee,duration,exit_time=calculate_fee(entry_time,v_type)
+            if is_vip:total_fee=0.0 
+            c.execute("DELETE FROM active_parking WHERE plate_number=?",(plate_text,))
+            parked_type=existing[2] # the spot freed is the one booked at entry, even if this read classified it differently
+            _after_commit(lambda:_bump_occupancy(parked_type,-1))
+            exit_time_str=exit_time.strftime("%Y-%m-%d %H:%M:%S")
+            c.execute("INSERT INTO transaction_history(plate_number,vehicle_type,entry_time,exit_time,duration_min,total_fee,image_path) VALUES(?,?,?,?,?,?,?)",(plate_text,v_type,entry_time_str,exit_time_str,duration,total_fee,entry_img))
+            _bump_rollups(c,exit_time_str,v_type,exits=1,revenue=total_fee)
+            return "Exit","Vehicle Exited",{"fee":total_fee,"time":duration,"is_vip":is_vip}
+        elif not existing and gate_mode in ["Entry","Auto"]:
+            occupied,limit=get_free_spots(v_type)
+            if occupied>=limit:return "Error",f"No {v_type} spots available!",None
+            entry_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            c.execute("INSERT INTO active_parking(plate_number,vehicle_type,entry_time,image_path) VALUES(?,?,?,?)",(plate_text,v_type,entry_time,img_path))
+            _bump_rollups(c,entry_time,v_type,entries=1)
+            _after_commit(lambda:_bump_occupancy(v_type,1))
+            return "Entry","Vehicle Entered",{"is_vip":is_vip}
+        else:return "Error","Invalid gate operation",None
+# bulk ingest, e.g. replaying a backlog from a gate that was offline - one commit for the whole batch
+@metrics.timed("db_call_seconds",fn="handle_vehicles")
+def handle_vehicles(events):
+    with transaction():
+        return [handle_vehicle(*ev) for ev in events]
 def calculate_fee(entry_time,vehicle_type):
     cfg=get_config()
     rate=cfg[4] if vehicle_type=='car' else cfg[5]
@@ -116,10 +267,120 @@ def calculate_fee(entry_time,vehicle_type):
         else:billable_hours=math.ceil(adjusted_min/60)
     total_fee=billable_hours*rate
     return total_fee,duration_min,exit_time
+@metrics.timed("db_call_seconds",fn="get_total_revenue")
 def get_total_revenue():
-    conn=sqlite3.connect(DB_NAME)
-    c=conn.cursor()
-    c.execute("SELECT SUM(total_fee) FROM transaction_history")
-    result=c.fetchone()[0]
-    conn.close()
-    return result if result else 0.0
\ No newline at end of file
+    result=get_conn().execute("SELECT SUM(revenue) FROM daily_stats").fetchone()[0]
+    return result if result else 0.0
+@metrics.timed("db_call_seconds",fn="get_today_revenue")
+def get_today_revenue():
+    result=get_conn().execute("SELECT SUM(revenue) FROM daily_stats WHERE day=?",(datetime.now().strftime("%Y-%m-%d"),)).fetchone()[0]
+    return result if result else 0.0
+# called inside the entry/exit transaction, ts is the "%Y-%m-%d %H:%M:%S" string being written
+def _bump_rollups(c,ts,v_type,entries=0,exits=0,revenue=0.0):
+    for table,key,bucket in [("hourly_stats","hour",ts[:13]),("daily_stats","day",ts[:10])]:
+        c.execute(f"INSERT INTO {table}({key},vehicle_type,entries,exits,revenue) VALUES(?,?,?,?,?) ON CONFLICT({key},vehicle_type) DO UPDATE SET entries=entries+excluded.entries,exits=exits+excluded.exits,revenue=revenue+excluded.revenue",(bucket,v_type,entries,exits,revenue))
+# recomputes both rollup tables from the raw tables, for existing databases or after manual edits
+@metrics.timed("db_call_seconds",fn="rebuild_rollups")
+def rebuild_rollups():
+    with transaction() as c:
+        c.execute("DELETE FROM hourly_stats")
+        c.execute("DELETE FROM daily_stats")
+        c.execute('''INSERT INTO hourly_stats(hour,vehicle_type,entries,exits,revenue)
+            SELECT hour,vehicle_type,SUM(e),SUM(x),SUM(r) FROM(
+                SELECT substr(entry_time,1,13) AS hour,vehicle_type,1 AS e,0 AS x,0.0 AS r FROM transaction_history
+                UNION ALL SELECT substr(entry_time,1,13),vehicle_type,1,0,0.0 FROM active_parking
+                UNION ALL SELECT substr(exit_time,1,13),vehicle_type,0,1,total_fee FROM transaction_history
+            ) GROUP BY hour,vehicle_type''')
+        c.execute("INSERT INTO daily_stats(day,vehicle_type,entries,exits,revenue) SELECT substr(hour,1,10),vehicle_type,SUM(entries),SUM(exits),SUM(revenue) FROM hourly_stats GROUP BY 1,2")
+# entries per hour of day (0-23), summed over every day on record
+@metrics.timed("db_call_seconds",fn="traffic_by_hour")
+def traffic_by_hour():
+    return get_conn().execute("SELECT CAST(substr(hour,12,2) AS INTEGER),SUM(entries) FROM hourly_stats GROUP BY 1 ORDER BY 1").fetchall()
+# revenue per weekday as (day name,revenue), Monday first
+@metrics.timed("db_call_seconds",fn="revenue_by_weekday")
+def revenue_by_weekday():
+    names=['Sunday','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday'] # sqlite's %w counts from Sunday
+    totals={names[int(w)]:rev for w,rev in get_conn().execute("SELECT strftime('%w',day),SUM(revenue) FROM daily_stats GROUP BY 1")}
+    return [(d,totals[d]) for d in names[1:]+names[:1] if d in totals]
+HISTORY_COLUMNS=["id","plate_number","vehicle_type","entry_time","exit_time","duration_min","total_fee","image_path"]
+ACTIVE_COLUMNS=["id","plate_number","vehicle_type","entry_time","image_path"]
+# WHERE clause for the History search, prefix searches stay on idx_history_plate
+def _plate_filter(query,mode):
+    if not query:return [],[]
+    # a plain range scan, LIKE 'X%' can't use the index because sqlite's LIKE is case-insensitive
+    if mode=="prefix":return ["plate_number>=?","plate_number<?"],[query,query+"\uffff"]
+    return ["instr(plate_number,?)>0"],[query]
+# one page of history, newest first - keyset pagination on id so page 500 costs the same as page 1
+@metrics.timed("db_call_seconds",fn="search_history")
+def search_history(query="",mode="prefix",before_id=None,limit=50):
+    where,params=_plate_filter(query,mode)
+    if before_id is not None:
+        where.append("id<?")
+        params.append(before_id)
+    sql=f"SELECT {','.join(HISTORY_COLUMNS)} FROM transaction_history"+(" WHERE "+" AND ".join(where) if where else "")+" ORDER BY id DESC LIMIT ?"
+    return get_conn().execute(sql,params+[limit]).fetchall()
+@metrics.timed("db_call_seconds",fn="search_active")
+def search_active(query="",mode="prefix"):
+    where,params=_plate_filter(query,mode)
+    sql=f"SELECT {','.join(ACTIVE_COLUMNS)} FROM active_parking"+(" WHERE "+" AND ".join(where) if where else "")+" ORDER BY id DESC"
+    return get_conn().execute(sql,params).fetchall()
+@metrics.timed("db_call_seconds",fn="history_revenue")
+def history_revenue(query="",mode="prefix"):
+    where,params=_plate_filter(query,mode)
+    result=get_conn().execute("SELECT SUM(total_fee) FROM transaction_history"+(" WHERE "+" AND ".join(where) if where else ""),params).fetchone()[0]
+    return result if result else 0.0
+# CSV export written straight from the cursor in chunks, never holding the full history in memory
+@metrics.timed("db_call_seconds",fn="export_history_csv")
+def export_history_csv(out,query="",mode="prefix",chunk=1000):
+    where,params=_plate_filter(query,mode)
+    cur=get_conn().execute(f"SELECT {','.join(HISTORY_COLUMNS[:-1])} FROM transaction_history"+(" WHERE "+" AND ".join(where) if where else "")+" ORDER BY id DESC",params)
+    writer=csv.writer(out)
+    writer.writerow(HISTORY_COLUMNS[:-1])
+    while True:
+        rows=cur.fetchmany(chunk)
+        if not rows:break
+        writer.writerows(rows)
+@metrics.timed("db_call_seconds",fn="log_gate_event")
+def log_gate_event(gate,status,plate,message,fee=None,duration=None,is_vip=False):
+    with transaction() as c:
+        cur=c.execute("INSERT INTO gate_events(ts,gate,status,plate_number,message,fee,duration_min,is_vip) VALUES(?,?,?,?,?,?,?,?)",(datetime.now().strftime("%Y-%m-%d %H:%M:%S"),gate,status,plate,message,fee,duration,int(bool(is_vip))))
+        return cur.lastrowid
+GATE_EVENT_COLUMNS=["id","ts","gate","status","plate_number","message","fee","duration_min","is_vip"]
+# newest first, or only the ones after a given id when polling for new events
+@metrics.timed("db_call_seconds",fn="get_gate_events")
+def get_gate_events(after_id=0,gate=None,limit=20):
+    sql=f"SELECT {','.join(GATE_EVENT_COLUMNS)} FROM gate_events WHERE id>?"+(" AND gate=?" if gate else "")+" ORDER BY id DESC LIMIT ?"
+    rows=get_conn().execute(sql,[after_id]+([gate] if gate else [])+[limit]).fetchall()
+    return [dict(zip(GATE_EVENT_COLUMNS,r)) for r in rows]
+@metrics.timed("db_call_seconds",fn="last_gate_event_id")
+def last_gate_event_id(gate=None):
+    if gate:return get_conn().execute("SELECT COALESCE(MAX(id),0) FROM gate_events WHERE gate=?",(gate,)).fetchone()[0]
+    return get_conn().execute("SELECT COALESCE(MAX(id),0) FROM gate_events").fetchone()[0]
+@metrics.timed("db_call_seconds",fn="update_gate_status")
+def update_gate_status(gate,gate_mode,source,stats):
+    now=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with transaction() as c:
+        c.execute("INSERT INTO gate_status(gate,gate_mode,source,pid,started,heartbeat,stats) VALUES(?,?,?,?,?,?,?) ON CONFLICT(gate) DO UPDATE SET started=CASE WHEN pid=excluded.pid THEN started ELSE excluded.started END,gate_mode=excluded.gate_mode,source=excluded.source,pid=excluded.pid,heartbeat=excluded.heartbeat,stats=excluded.stats",(gate,gate_mode,str(source),os.getpid(),now,now,json.dumps(stats)))
+@metrics.timed("db_call_seconds",fn="get_gate_status")
+def get_gate_status():
+    rows=get_conn().execute("SELECT gate,gate_mode,source,pid,started,heartbeat,stats FROM gate_status ORDER BY gate").fetchall()
+    return [{"gate":g,"gate_mode":m,"source":src,"pid":pid,"started":st,"heartbeat":hb,"stats":json.loads(stats) if stats else {}} for g,m,src,pid,st,hb,stats in rows]
+@metrics.timed("db_call_seconds",fn="get_detector_config")
+def get_detector_config():
+    backend,precision,imgsz,ocr_backend=get_conn().execute("SELECT backend,precision,imgsz,ocr_backend FROM detector_config WHERE id=1").fetchone()
+    return {"backend":backend,"precision":precision,"imgsz":imgsz,"ocr_backend":ocr_backend}
+@metrics.timed("db_call_seconds",fn="update_detector_config")
+def update_detector_config(backend,precision,imgsz,ocr_backend):
+    with transaction() as c:
+        c.execute("UPDATE detector_config SET backend=?,precision=?,imgsz=?,ocr_backend=? WHERE id=1",(backend,precision,int(imgsz),ocr_backend))
+if __name__=="__main__":
+    import argparse
+    parser=argparse.ArgumentParser(description="Parking database maintenance")
+    parser.add_argument("--db",default=DB_NAME)
+    parser.add_argument("--rebuild-rollups",action="store_true",help="recompute hourly/daily analytics tables from history")
+    args=parser.parse_args()
+    DB_NAME=args.db
+    init_db()
+    if args.rebuild_rollups:
+        rebuild_rollups()
+        print(f"Rollups rebuilt: {get_conn().execute('SELECT count(*) FROM hourly_stats').fetchone()[0]} hourly rows")
@@ -1,57 +1,633 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
-import easyocr
-import torch
 import re
+import metrics
+import threading
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor,wait as wait_futures
 
 model=None
 reader=None
+ocr_executor=None
+stage_hook=None # optional callable(stage,seconds) fed with the cost of track/clahe/ocr, used by benchmark.py
+OCR_WORKERS=2 # easyocr releases the GIL inside torch, so a couple of threads keep the recognizer busy without starving tracking
+OCR_MAX_INFLIGHT=4
+VEHICLE_CLASSES=[2,3,5,7] # car, motorcycle, bus, truck
+VOTE_AGREEMENT=0.7 # weighted share every character position needs before a plate is accepted
+VOTE_MIN_READS=2
+VOTE_MAX_READS=6 # after this many matching reads the best consensus is taken as is
+VOTE_LOST_FRAMES=30 # frames a track can vanish for before its partial vote is settled
+MIN_ROI_AREA=3000 # px, anything smaller never yields a readable plate
+MIN_ROI_ASPECT,MAX_ROI_ASPECT=0.5,4.0 # width/height of the plate search crop
+MAX_TRACK_SPEED=0.15 # box heights per frame, faster than this the plate is motion smeared
+MIN_SHARPNESS=60.0 # variance of the Laplacian, below this the crop is too blurred to read
+PLATE_PATTERN=re.compile(r'[A-Z]{2}[0-9]{1,2}[A-Z]{1,2}[0-9]{4}')
+IDLE_STRIDE=10 # with nothing moving only every Nth frame goes through YOLO
+MOTION_WIDTH=160 # px, the frame difference runs on a thumbnail this wide
+MOTION_PIXEL_DELTA=25 # grey levels a thumbnail pixel must change by to count as moving
+MOTION_THRESHOLD=0.002 # share of moving thumbnail pixels that wakes the detector up
+MOTION_HOLD=30 # frames kept at full rate after the last motion or track
+TRIGGER_BAND=0.12 # half height of the strip inferred around a trigger line, as a share of the frame
+
+YOLO_WEIGHTS='yolov8n.pt'
+BACKENDS=("torch","onnx","openvino")
+PRECISIONS=("fp32","int8")
+backend="torch" # torch | onnx (onnxruntime) | openvino, exported next to the .pt weights on first use
+precision="fp32" # int8 = dynamically quantized onnx / nncf quantized openvino, for cpu-only gates
+imgsz=640 # network input size, smaller trades range for speed
+ocr_backend="torch" # torch | onnx for the easyocr recognizer
+device=None # None lets torch/ultralytics pick (cuda when present), "cpu" pins both models to the cpu
+
+def configure(backend_name=None,precision_name=None,size=None,ocr=None,device_name=None):
+    global backend,precision,imgsz,ocr_backend,device,model,reader
+    if backend_name is not None and backend_name not in BACKENDS:raise ValueError(f"unknown backend {backend_name}")
+    if precision_name is not None and precision_name not in PRECISIONS:raise ValueError(f"unknown precision {precision_name}")
+    new=(backend_name or backend,precision_name or precision,int(size or imgsz),ocr or ocr_backend)
+    if new[:3]!=(backend,precision,imgsz):model=None # reloaded with the new export on next use
+    if new[3]!=ocr_backend or (new[3]=="onnx" and new[1]!=precision):reader=None
+    if device_name is not None and device_name!=device:model,reader=None,None
+    if model is None or reader is None:_status.update(state="idle",seconds=None)
+    backend,precision,imgsz,ocr_backend=new
+    if device_name is not None:device=device_name
+
+# exports the detector for a backend once and returns what YOLO() should load, file names carry size and precision so a settings change never picks up a stale export
+def export_yolo(weights=YOLO_WEIGHTS,backend_name=None,precision_name=None,size=None):
+    from ultralytics import YOLO
+    backend_name,precision_name,size=backend_name or backend,precision_name or precision,int(size or imgsz)
+    if backend_name=="torch":return weights
+    stem=os.path.splitext(weights)[0]
+    if backend_name=="onnx":
+        fp32=f"{stem}_{size}.onnx"
+        if not os.path.exists(fp32):os.replace(YOLO(weights).export(format="onnx",imgsz=size,dynamic=True,simplify=True),fp32) # dynamic batch for the multi gate path
+        if precision_name=="fp32":return fp32
+        int8=f"{stem}_{size}_int8.onnx"
+        if not os.path.exists(int8):
+            import onnx
+            from onnxruntime.quantization import quantize_dynamic,QuantType
+            quantize_dynamic(fp32,int8,weight_type=QuantType.QUInt8)
+            # ultralytics reads class names and stride from the model metadata, carry them over
+            src,q=onnx.load(fp32),onnx.load(int8)
+            del q.metadata_props[:]
+            q.metadata_props.extend(src.metadata_props)
+            onnx.save(q,int8)
+        return int8
+    target=f"{stem}_{size}_{precision_name}_openvino_model"
+    if not os.path.exists(target):
+        out=YOLO(weights).export(format="openvino",imgsz=size,dynamic=True,int8=precision_name=="int8")
+        os.replace(out,target)
+    return target
+
+def load_yolo():
+    from ultralytics import YOLO
+    return YOLO(export_yolo(),task="detect")
+
+# drop-in for the easyocr recognizer module, easyocr only ever calls model(image,text) under no_grad
+# the torch.nn wrappers are declared on first use so importing detector never pulls torch in
+def onnx_recognizer(path):
+    import torch
+    import onnxruntime as ort
+    class OnnxRecognizer(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.session=ort.InferenceSession(path,providers=["CPUExecutionProvider"])
+            self.input_name=self.session.get_inputs()[0].name
+        def forward(self,image,text=None):
+            out=self.session.run(None,{self.input_name:image.detach().cpu().float().numpy()})[0]
+            return torch.from_numpy(out).to(image.device)
+    return OnnxRecognizer()
+
+def export_recognizer(reader_inst,precision_name=None):
+    precision_name=precision_name or precision
+    folder=os.path.expanduser(reader_inst.model_storage_directory)
+    fp32=os.path.join(folder,"recognizer_en.onnx")
+    if not os.path.exists(fp32):
+        import torch
+        class RecognizerExport(torch.nn.Module):
+            def __init__(self,net):
+                super().__init__()
+                self.net=net
+            def forward(self,image):return self.net(image,None) # the text argument is unused at inference
+        net=reader_inst.recognizer
+        net=getattr(net,"module",net) # unwrap DataParallel
+        net.eval()
+        dummy=torch.rand(1,1,64,256) # easyocr feeds 64 px high grayscale strips of varying width
+        torch.onnx.export(RecognizerExport(net),(dummy,),fp32,input_names=["image"],output_names=["preds"],dynamic_axes={"image":{0:"batch",3:"width"},"preds":{0:"batch",1:"steps"}},opset_version=17)
+    if precision_name=="fp32":return fp32
+    int8=os.path.join(folder,"recognizer_en_int8.onnx")
+    if not os.path.exists(int8):
+        from onnxruntime.quantization import quantize_dynamic,QuantType
+        quantize_dynamic(fp32,int8,weight_type=QuantType.QInt8)
+    return int8
+
+def load_reader():
+    import torch
+    import easyocr
+    gpu_avail=torch.cuda.is_available() if device is None else device!="cpu"
+    use_onnx=ocr_backend=="onnx" and not gpu_avail
+    # easyocr quantizes the cpu recognizer with torch by default, which onnx export can't trace
+    reader_inst=easyocr.Reader(['en'],gpu=gpu_avail,quantize=not use_onnx)
+    loaded["ocr_backend"]="torch"
+    if use_onnx:
+        try:
+            reader_inst.recognizer=onnx_recognizer(export_recognizer(reader_inst))
+            loaded["ocr_backend"]="onnx"
+        except Exception as e: # the recognizer's lstm doesn't export on every torch release
+            print(f"ONNX recognizer unavailable, staying on torch: {e}",flush=True)
+            torch.quantization.quantize_dynamic(reader_inst.recognizer,dtype=torch.qint8,inplace=True)
+    return reader_inst
+
+_load_lock=threading.Lock()
+_warmup_lock=threading.Lock() # separate from _load_lock, which is held for the whole multi second load
+_warmup_thread=None
+_status={"state":"idle","error":None,"seconds":None} # idle -> loading -> ready | error
+loaded={"backend":None,"precision":None,"ocr_backend":None,"fallback":None} # what actually runs, can differ from the configured backend after a fallback
 
 def load_models():
     global model,reader
-    if model is None:model=YOLO('yolov8n.pt') 
-    if reader is None:
-        gpu_avail=torch.cuda.is_available()
-        reader=easyocr.Reader(['en'],gpu=gpu_avail)
+    if model is not None and reader is not None:return model,reader # hot path, called every frame
+    with _load_lock: # the warm-up thread and the first frame must not load twice
+        if model is None:
+            try:
+                model=load_yolo()
+                loaded.update(backend=backend,precision=precision if backend!="torch" else "fp32",fallback=None)
+            except Exception as e: # a missing onnxruntime/openvino must not take the gate down
+                print(f"{backend} backend unavailable, falling back to torch: {e}",flush=True)
+                from ultralytics import YOLO
+                model=YOLO(YOLO_WEIGHTS)
+                loaded.update(backend="torch",precision="fp32",fallback=f"{backend}/{precision}: {e}")
+        if reader is None:reader=load_reader()
     return model,reader
 
-def detect_frame(frame,processed_ids,conf_thresh=0.25): # Lowered thresh for harsh sunlight
+# loads both models and pushes one dummy image through each, so the first real vehicle doesn't pay for lazy init
+def warmup():
+    t0=time.perf_counter()
+    _status.update(state="loading",error=None,seconds=None)
+    try:
+        model_inst,reader_inst=load_models()
+        model_inst.predict(np.zeros((imgsz,imgsz,3),dtype=np.uint8),imgsz=imgsz,device=device,verbose=False)
+        reader_inst.readtext(np.zeros((64,256),dtype=np.uint8))
+        _status.update(state="ready",seconds=time.perf_counter()-t0)
+    except Exception as e:_status.update(state="error",error=str(e))
+
+# background warm-up, a no-op while one is running or the configured models are already loaded
+def start_warmup():
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():return
+        if model is not None and reader is not None and _status["state"]=="ready":return
+        _warmup_thread=threading.Thread(target=warmup,name="model-warmup",daemon=True)
+        _warmup_thread.start()
+
+# backend/precision/ocr_backend report what is loaded once the models are in, the configured values before that
+def model_status():
+    active=model is not None and loaded["backend"] is not None
+    return dict(_status,backend=loaded["backend"] if active else backend,precision=loaded["precision"] if active else precision,
+                ocr_backend=loaded["ocr_backend"] if reader is not None and loaded["ocr_backend"] else ocr_backend,imgsz=imgsz,
+                configured=f"{backend}/{precision}/ocr-{ocr_backend}",fallback=loaded["fallback"] if active else None)
+
+def get_ocr_executor():
+    global ocr_executor
+    if ocr_executor is None:ocr_executor=ThreadPoolExecutor(max_workers=OCR_WORKERS,thread_name_prefix="ocr")
+    return ocr_executor
+
+def _record(stage,t0):
+    if stage_hook or metrics.enabled():
+        dt=time.perf_counter()-t0
+        if stage_hook:stage_hook(stage,dt)
+        metrics.observe("detector_stage_seconds",dt,stage=stage)
+
+def enhance_roi(roi,gray=None):
+    # FIX: Multi-step preprocessing to beat the sun glare
+    if gray is None:gray=cv2.cvtColor(roi,cv2.COLOR_BGR2GRAY)
+    # Use CLAHE (Contrast Limited Adaptive Histogram Equalization) to balance the glare
+    clahe=cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
+    return clahe.apply(gray)
+
+# cheap checks that run before any CLAHE/OCR work, returns why a crop is not worth reading or None
+# still images skip the clipped and motion checks, a close-up upload often touches the frame edge and there is no later frame to wait for
+# bounds=(left,top,right,bottom) of the inferred area, top/bottom None where that edge is the frame's own
+def roi_reject_reason(roi,gray,box,bounds,speed,still=False):
+    x1,y1,x2,y2=box
+    left,top,right,bottom=bounds
+    h,w=roi.shape[:2]
+    if h*w<MIN_ROI_AREA:return "too_small"
+    if not MIN_ROI_ASPECT<=w/h<=MAX_ROI_ASPECT:return "aspect"
+    if not still:
+        # half the vehicle is outside the frame, or outside the gate region that was inferred
+        if x1<=left+1 or x2>=right-1 or (top is not None and y1<=top+1) or (bottom is not None and y2>=bottom-1):return "clipped"
+        if speed>MAX_TRACK_SPEED:return "moving"
+    if cv2.Laplacian(gray,cv2.CV_64F).var()<MIN_SHARPNESS:return "blurry"
+    return None
+
+# runs on an ocr worker thread, returns the plate and the mean easyocr confidence of the pieces it was built from
+def read_plate(reader_inst,enhanced):
+    t0=time.perf_counter()
+    ocr_results=reader_inst.readtext(enhanced,allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
+    _record("ocr",t0)
+    pieces=[(text.replace(" ","").upper(),conf) for _,text,conf in ocr_results if conf>0.15]
+    if not pieces:return None
+    match=PLATE_PATTERN.search("".join(t for t,_ in pieces))
+    if not match:return None
+    return match.group(),sum(c for _,c in pieces)/len(pieces)
+
+# confidence weighted vote over several reads of the same track, character by character
+class PlateVote:
+    def __init__(self):
+        self.reads=[] # (plate text,weight)
+        self.last_seen=0
+    def add(self,text,weight):self.reads.append((text,max(weight,1e-3)))
+    def consensus(self):
+        total=sum(w for _,w in self.reads)
+        # settle the length first so position i lines up across every read that takes part
+        by_len={}
+        for t,w in self.reads:by_len[len(t)]=by_len.get(len(t),0)+w
+        length=max(by_len,key=by_len.get)
+        agreement=by_len[length]/total
+        chars=[]
+        for i in range(length):
+            tally={}
+            for t,w in self.reads:
+                if len(t)==length:tally[t[i]]=tally.get(t[i],0)+w
+            ch=max(tally,key=tally.get)
+            chars.append(ch)
+            agreement=min(agreement,tally[ch]/total)
+        plate="".join(chars)
+        # per position winners from different plate layouts can stitch together something that isn't a plate
+        return (plate,agreement) if PLATE_PATTERN.fullmatch(plate) else (None,0.0)
+    def decision(self):
+        if len(self.reads)<VOTE_MIN_READS:return None
+        plate,agreement=self.consensus()
+        if plate and (agreement>=VOTE_AGREEMENT or len(self.reads)>=VOTE_MAX_READS):return plate,agreement
+        return None
+
+# OCR jobs in flight for one camera, results are joined back by track id on later frames so tracking never waits
+class OcrPool:
+    def __init__(self,max_inflight=OCR_MAX_INFLIGHT):
+        self.max_inflight=max_inflight
+        self.frame_no=0
+        self.pending={} # track id -> (future,vehicle type)
+        self.votes={} # track id -> (PlateVote,vehicle type) still collecting reads
+        self.ready={} # track id -> detection dict waiting to be handed out
+        self.labels={} # track id -> plate text for on-frame annotation
+        self.centers={} # track id -> (cx,cy,frame no) for the motion check
+        self.rejects={} # quality gate reason -> crops skipped
+        self.accepted=set() # tracks with a settled plate, never re-read even before the sink has marked them processed
+        self.submitted=0
+    # box centre displacement per frame, in box heights so near and far vehicles compare the same
+    def track_speed(self,t_id,box):
+        x1,y1,x2,y2=box
+        cx,cy=(x1+x2)/2,(y1+y2)/2
+        prev=self.centers.get(t_id)
+        self.centers[t_id]=(cx,cy,self.frame_no)
+        if prev is None or prev[2]>=self.frame_no:return 0.0
+        return ((cx-prev[0])**2+(cy-prev[1])**2)**0.5/max(y2-y1,1)/(self.frame_no-prev[2])
+    def reject(self,reason):
+        self.rejects[reason]=self.rejects.get(reason,0)+1
+        metrics.inc("ocr_skipped_crops_total",reason=reason)
+    def is_busy(self,t_id):return t_id in self.pending or t_id in self.ready or t_id in self.accepted
+    def has_capacity(self):return len(self.pending)<self.max_inflight
+    def submit(self,t_id,v_type,enhanced,reader_inst):
+        self.pending[t_id]=(get_ocr_executor().submit(read_plate,reader_inst,enhanced),v_type)
+        self.submitted+=1
+        metrics.inc("ocr_attempts_total")
+    def wait(self,timeout=None):
+        if self.pending:wait_futures([f for f,_ in self.pending.values()],timeout=timeout)
+    def collect(self):
+        self.frame_no+=1
+        for t_id,(fut,v_type) in list(self.pending.items()):
+            if not fut.done():continue
+            del self.pending[t_id]
+            try:read=fut.result()
+            except Exception:read=None # a failed read just means the track gets queued again next frame
+            if not read or t_id in self.accepted:continue # late read for a track that already has its plate
+            metrics.inc("ocr_regex_matches_total")
+            vote,_=self.votes.setdefault(t_id,(PlateVote(),v_type))
+            vote.add(*read)
+            vote.last_seen=self.frame_no
+            decided=vote.decision()
+            if decided:self._accept(t_id,*decided)
+    def _accept(self,t_id,plate,agreement):
+        _,v_type=self.votes.pop(t_id)
+        metrics.inc("plates_accepted_total")
+        self.ready[t_id]={'text':plate,'type':v_type,'conf':round(agreement,3),'track_id':t_id}
+        self.labels[t_id]=plate
+        self.accepted.add(t_id)
+    # called with the tracks visible this frame, settles tracks that left view before reaching agreement (or every visible one when forced)
+    def expire(self,seen_ids,force=False):
+        for t_id,(vote,_) in list(self.votes.items()):
+            if t_id in seen_ids:
+                vote.last_seen=self.frame_no
+                if not force:continue
+            elif self.frame_no-vote.last_seen<=VOTE_LOST_FRAMES:continue
+            plate,agreement=vote.consensus()
+            # a track that drove off still has to clear the same bar as a live one, only a forced settle (still image, end of source) takes what there is
+            if plate and not (force and t_id in seen_ids) and (len(vote.reads)<VOTE_MIN_READS or agreement<VOTE_AGREEMENT):plate=None
+            if plate:self._accept(t_id,plate,agreement)
+            else:del self.votes[t_id]
+    def pop_ready(self,processed_ids):
+        for t_id in list(self.ready):
+            data=self.ready.pop(t_id)
+            if t_id not in processed_ids:return data
+        return None
+    # end of a source: waits for the reads still in flight and settles every open vote, returns everything still owed
+    def drain(self,processed_ids):
+        self.wait()
+        self.collect()
+        self.expire(set(self.votes),force=True)
+        out=[]
+        while True:
+            data=self.pop_ready(processed_ids)
+            if data is None:return out
+            out.append(data)
+
+ocr_pool=OcrPool()
+
+# the part of a gate camera worth inferring: a polygon around the barrier lane, or a strip along a trigger line
+# points are pixels, or fractions of the frame when every coordinate is <=1 so one config fits any resolution
+class GateRegion:
+    def __init__(self,polygon=None,trigger_line=None,band=TRIGGER_BAND):
+        if not polygon and not trigger_line:raise ValueError("a gate region needs a polygon or a trigger line")
+        if polygon and len(polygon)<3:raise ValueError("a gate polygon needs at least 3 points")
+        if not polygon and len(trigger_line)!=2:raise ValueError("a trigger line needs exactly 2 points")
+        self.polygon=polygon
+        self.trigger_line=trigger_line
+        self.band=band
+        self._shape=None
+    def _resolve(self,w,h):
+        if self._shape==(w,h):return
+        pts=self.polygon or self.trigger_line
+        norm=all(0<=x<=1 and 0<=y<=1 for x,y in pts)
+        pts=np.array([(x*w,y*h) if norm else (x,y) for x,y in pts],dtype=np.int32)
+        if self.polygon:
+            x1,y1=pts.min(axis=0)
+            x2,y2=pts.max(axis=0)
+        else:
+            bx,by=int(w*self.band),int(h*self.band)
+            x1,y1=pts.min(axis=0)-(bx,by)
+            x2,y2=pts.max(axis=0)+(bx,by)
+        x1,y1,x2,y2=max(int(x1),0),max(int(y1),0),min(int(x2),w),min(int(y2),h)
+        if x2-x1<32 or y2-y1<32:raise ValueError(f"gate region {x1},{y1}-{x2},{y2} is too small for a {w}x{h} frame")
+        self.pts,self.rect=pts,(x1,y1,x2,y2)
+        self.mask=None
+        # a plain axis aligned rectangle needs no mask, anything else blanks out what lies outside the polygon
+        if self.polygon and not (len(pts)==4 and cv2.contourArea(pts)==(x2-x1)*(y2-y1)):
+            self.mask=np.zeros((y2-y1,x2-x1),dtype=np.uint8)
+            cv2.fillPoly(self.mask,[pts-(x1,y1)],255)
+        self._shape=(w,h)
+    def crop(self,frame):
+        h,w=frame.shape[:2]
+        self._resolve(w,h)
+        x1,y1,x2,y2=self.rect
+        roi=frame[y1:y2,x1:x2]
+        if self.mask is not None:roi=cv2.bitwise_and(roi,roi,mask=self.mask)
+        return roi,(x1,y1)
+    # edges for the clipped check, frame borders stay None so the full frame rule (sides only) is unchanged there
+    # a trigger strip is narrower than most vehicles, every box would touch its top and bottom, so only its sides count
+    def bounds(self):
+        x1,y1,x2,y2=self.rect
+        w,h=self._shape
+        if not self.polygon:return x1,None,x2,None
+        return x1,y1 if y1>0 else None,x2,y2 if y2<h else None
+    def draw(self,img):
+        h,w=img.shape[:2]
+        self._resolve(w,h)
+        if self.polygon:cv2.polylines(img,[self.pts],True,(255,128,0),2)
+        else:cv2.line(img,tuple(map(int,self.pts[0])),tuple(map(int,self.pts[-1])),(255,128,0),2)
+
+# adaptive frame skipping: a thumbnail frame difference decides whether YOLO runs at full rate or every IDLE_STRIDE frames
+class FrameScheduler:
+    def __init__(self,idle_stride=IDLE_STRIDE,threshold=MOTION_THRESHOLD,hold=MOTION_HOLD):
+        self.idle_stride=idle_stride
+        self.threshold=threshold
+        self.hold=hold
+        self.prev=None
+        self.hold_left=0
+        self.since_infer=0
+        self.inferred=0
+        self.skipped=0
+    def motion(self,img):
+        h,w=img.shape[:2]
+        if w>MOTION_WIDTH:img=cv2.resize(img,(MOTION_WIDTH,max(int(h*MOTION_WIDTH/w),1)),interpolation=cv2.INTER_AREA)
+        gray=cv2.GaussianBlur(cv2.cvtColor(img,cv2.COLOR_BGR2GRAY),(5,5),0) # blur so sensor noise never counts as motion
+        prev,self.prev=self.prev,gray
+        if prev is None or prev.shape!=gray.shape:return 1.0
+        _,moving=cv2.threshold(cv2.absdiff(prev,gray),MOTION_PIXEL_DELTA,255,cv2.THRESH_BINARY)
+        return cv2.countNonZero(moving)/moving.size
+    # busy = tracks or plate votes still open, a car waiting at the barrier doesn't move but still needs reading
+    def should_infer(self,img,busy=False):
+        if self.idle_stride<=1:run=True
+        else:
+            moving=self.motion(img)>=self.threshold # always run, the reference thumbnail has to stay current
+            if busy or moving:self.hold_left=self.hold
+            elif self.hold_left>0:self.hold_left-=1
+            self.since_infer+=1
+            run=self.hold_left>0 or self.since_infer>=self.idle_stride
+        if run:
+            self.since_infer=0
+            self.inferred+=1
+        else:self.skipped+=1
+        metrics.inc("detector_frames_total",mode="inferred" if run else "skipped")
+        return run
+    # only vehicles still waiting for a plate keep full rate, a parked or already billed car must not block idle mode
+    def note_tracks(self,r,processed_ids):
+        if r.boxes.id is not None and any(int(t) not in processed_ids for t in r.boxes.id.tolist()):self.hold_left=self.hold
+    def stats(self):return {"inferred":self.inferred,"skipped":self.skipped,"idle":self.hold_left==0}
+
+# boxes inferred on a region crop, moved back into full frame coordinates
+def shift_result(r,frame,offset):
+    r.orig_img=frame
+    r.orig_shape=frame.shape[:2]
+    data=r.boxes.data.clone()
+    data[:,[0,2]]+=offset[0]
+    data[:,[1,3]]+=offset[1]
+    r.update(boxes=data)
+    return r
+
+# a skipped frame: no inference, but an OCR vote that settles meanwhile is still handed out
+def idle_frame(frame,processed_ids,pool,region=None):
+    annotated=frame
+    if region:
+        annotated=frame.copy()
+        region.draw(annotated)
+    pool.collect()
+    return annotated,pool.pop_ready(processed_ids)
+
+def detect_frame(frame,processed_ids,conf_thresh=0.25,wait=False,region=None,scheduler=None): # Lowered thresh for harsh sunlight
     model_inst,reader_inst=load_models()
-    results=model_inst.track(frame,classes=[2,3,5,7],conf=conf_thresh,persist=True,tracker="bytetrack.yaml",verbose=False)
+    roi,offset=region.crop(frame) if region else (frame,(0,0))
+    if scheduler and not scheduler.should_infer(roi,busy=bool(ocr_pool.pending or ocr_pool.votes)):return idle_frame(frame,processed_ids,ocr_pool,region)
+    t0=time.perf_counter()
+    results=model_inst.track(roi,classes=VEHICLE_CLASSES,conf=conf_thresh,imgsz=imgsz,device=device,persist=True,tracker="bytetrack.yaml",verbose=False)
+    _record("track",t0)
+    r=shift_result(results[0],frame,offset) if region else results[0]
+    if scheduler:scheduler.note_tracks(r,processed_ids)
+    annotated,data=process_result(frame,r,processed_ids,ocr_pool,reader_inst,wait,region.bounds() if region else None)
+    if region:region.draw(annotated)
+    return annotated,data
+
+# draws the tracked boxes and queues OCR for new tracks, shared by the single and multi camera paths
+def process_result(frame,r,processed_ids,pool,reader_inst,wait=False,bounds=None):
+    bounds=bounds or (0,None,frame.shape[1],None)
     annotated_frame=frame.copy()
-    detection_data=None 
+    pool.collect()
+    label_pos={} # track id -> where its plate text goes once the read lands
+    track_boxes={} # track id -> box this frame, handed out with the plate for the evidence crop
 
-    for r in results:
-        if r.boxes.id is None:continue 
+    if r.boxes.id is not None:
         for box,trk_id in zip(r.boxes,r.boxes.id):
             x1,y1,x2,y2=map(int,box.xyxy[0])
             cls_id=int(box.cls[0])
             t_id=int(trk_id.item())
-            
+            label_pos[t_id]=(x1,y2+25)
+            track_boxes[t_id]=(x1,y1,x2,y2)
+
             v_type,color,label_text=("bike",(0,255,255),f"BIKE ID:{t_id}") if cls_id==3 else ("car",(0,255,0),f"CAR ID:{t_id}")
             cv2.rectangle(annotated_frame,(x1,y1),(x2,y2),color,2)
+            speed=pool.track_speed(t_id,(x1,y1,x2,y2))
 
-            if t_id not in processed_ids and detection_data is None:
+            if t_id not in processed_ids and not pool.is_busy(t_id) and pool.has_capacity():
                 # 0.25 crop to ensure we get the full trunk area even if car box is slightly off
-                plate_y1=y1+int((y2-y1)*0.25) 
-                roi=frame[plate_y1:y2,x1:x2]
-                
+                plate_y1=y1+int((y2-y1)*0.25)
+                roi=frame[max(plate_y1,0):y2,max(x1,0):x2]
                 if roi.size>0:
-                    # FIX: Multi-step preprocessing to beat the sun glare
                     gray=cv2.cvtColor(roi,cv2.COLOR_BGR2GRAY)
-                    # Use CLAHE (Contrast Limited Adaptive Histogram Equalization) to balance the glare
-                    clahe=cv2.createCLAHE(clipLimit=2.0,tileGridSize=(8,8))
-                    enhanced=clahe.apply(gray)
-                    
-                    ocr_results=reader_inst.readtext(enhanced,allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789')
-                    plate_texts=[text.replace(" ","").upper() for _,text,conf in ocr_results if conf>0.15]
-                    
-                    if plate_texts:
-                        full_string="".join(plate_texts)
-                        match=re.search(r'[A-Z]{2}[0-9]{1,2}[A-Z]{1,2}[0-9]{4}',full_string)
-                        if match:
-                            full_plate=match.group()
-                            detection_data={'text':full_plate,'type':v_type,'conf':0.99,'track_id':t_id}
-                            cv2.putText(annotated_frame,f"PLATE: {full_plate}",(x1,y2+25),cv2.FONT_HERSHEY_SIMPLEX,0.7,(255,255,255),2)
-    return annotated_frame,detection_data
\ No newline at end of file
+                    reason=roi_reject_reason(roi,gray,(x1,y1,x2,y2),bounds,speed,still=wait)
+                    if reason:pool.reject(reason)
+                    else:
+                        t0=time.perf_counter()
+                        enhanced=enhance_roi(roi,gray)
+                        _record("clahe",t0)
+                        pool.submit(t_id,v_type,enhanced,reader_inst)
+    # single images have no later frame to pick the result up on
+    if wait:
+        pool.wait()
+        pool.collect()
+        pool.expire(label_pos,force=True) # a still image only ever gets one read per track
+    else:pool.expire(label_pos)
+    pool.labels={t_id:txt for t_id,txt in pool.labels.items() if t_id in label_pos}
+    pool.centers={t_id:c for t_id,c in pool.centers.items() if pool.frame_no-c[2]<=VOTE_LOST_FRAMES}
+    pool.accepted&=pool.centers.keys()|pool.ready.keys() # forgotten together with the track, by then the sink has long marked it processed
+    for t_id,txt in pool.labels.items():cv2.putText(annotated_frame,f"PLATE: {txt}",label_pos[t_id],cv2.FONT_HERSHEY_SIMPLEX,0.7,(255,255,255),2)
+    data=pool.pop_ready(processed_ids)
+    if data:data['box']=track_boxes.get(data['track_id'])
+    return annotated_frame,data
+
+def new_tracker(frame_rate=30,tracker_cfg="bytetrack.yaml"):
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    try:
+        from ultralytics.utils import YAML
+        cfg=YAML.load(check_yaml(tracker_cfg))
+    except ImportError: # older ultralytics releases
+        from ultralytics.utils import yaml_load
+        cfg=yaml_load(check_yaml(tracker_cfg))
+    return BYTETracker(args=IterableSimpleNamespace(**cfg),frame_rate=frame_rate)
+
+# same as ultralytics' own track callback, but with the tracker picked per camera instead of per batch slot
+def apply_tracker(tracker,r,frame):
+    dets=r.boxes.cpu().numpy()
+    tracks=tracker.update(dets,frame)
+    if len(tracks)==0:return r[[]]
+    idx=tracks[:,-1].astype(int)
+    r=r[idx]
+    import torch
+    r.update(boxes=torch.as_tensor(tracks[:,:-1]))
+    return r
+
+# several gate cameras sharing one YOLO forward pass per batch, each keeping its own ByteTrack state and OCR pool
+class MultiGateDetector:
+    def __init__(self,gates,conf_thresh=0.25):
+        import pipeline # late import, pipeline builds on detect_frame
+        self.conf_thresh=conf_thresh
+        self.batch_model=None # kept apart from the single camera model so persist=True trackers never mix
+        self.stop_evt=threading.Event()
+        self.gates=[]
+        for name,source,gate_mode,*extra in gates: # optional (region,scheduler) per gate
+            region,scheduler=(list(extra)+[None,None])[:2]
+            cap=cv2.VideoCapture(source)
+            fps=cap.get(cv2.CAP_PROP_FPS)
+            self.gates.append({"name":name,"source":source,"gate_mode":gate_mode,"cap":cap,"frames":pipeline.LatestQueue(1),"tracker":new_tracker(int(fps) if fps and fps>0 else 30),"pool":OcrPool(),"processed":set(),"done":threading.Event(),"drained":False,"last_frame":None,
+                               "realtime":os.path.isfile(str(source)), # files play at their own fps, like FramePipeline(realtime=True)
+                               "region":region,"scheduler":scheduler})
+    def _capture_loop(self,g):
+        import pipeline
+        try:pipeline.capture_frames(g["cap"],g["frames"].put,self.stop_evt,g["realtime"])
+        finally:g["done"].set()
+    def start(self):
+        for g in self.gates:threading.Thread(target=self._capture_loop,args=(g,),name=f"capture-{g['name']}",daemon=True).start()
+        return self
+    def stop(self):
+        self.stop_evt.set()
+        for g in self.gates:g["cap"].release()
+    def is_running(self):
+        return not self.stop_evt.is_set() and any(not g["done"].is_set() or g["frames"].depth()>0 for g in self.gates)
+    # one batched forward pass over the newest frame of every camera that has one
+    def step(self,timeout=0.05):
+        batch=[]
+        out=[]
+        waited=False
+        for g in self.gates:
+            frame=g["frames"].get(timeout if not waited else 0)
+            if frame is None:continue
+            waited=True
+            g["last_frame"]=frame
+            roi,offset=g["region"].crop(frame) if g["region"] else (frame,(0,0))
+            pool=g["pool"]
+            if g["scheduler"] and not g["scheduler"].should_infer(roi,busy=bool(pool.pending or pool.votes)):
+                annotated,data=idle_frame(frame,g["processed"],pool,g["region"])
+                out.append((g,annotated,data))
+            else:batch.append((g,frame,roi,offset))
+        if not batch:return out
+        if self.batch_model is None:self.batch_model=load_yolo()
+        _,reader_inst=load_models()
+        t0=time.perf_counter()
+        results=self.batch_model.predict([roi for _,_,roi,_ in batch],classes=VEHICLE_CLASSES,conf=self.conf_thresh,imgsz=imgsz,device=device,verbose=False)
+        _record("batch_predict",t0)
+        for (g,frame,roi,offset),r in zip(batch,results):
+            if g["region"]:r=shift_result(r,frame,offset)
+            r=apply_tracker(g["tracker"],r,frame)
+            if g["scheduler"]:g["scheduler"].note_tracks(r,g["processed"])
+            annotated,data=process_result(frame,r,g["processed"],g["pool"],reader_inst,bounds=g["region"].bounds() if g["region"] else None)
+            if g["region"]:g["region"].draw(annotated)
+            out.append((g,annotated,data))
+        return out
+    # a camera whose source ended still owes the reads in flight for its last vehicles
+    def drain_finished(self,on_detection):
+        for g in self.gates:
+            if g["drained"] or not g["done"].is_set() or g["frames"].depth()>0:continue
+            g["drained"]=True
+            for data in g["pool"].drain(g["processed"]):
+                if g["last_frame"] is not None:on_detection(g,g["last_frame"],data)
+    def run(self,on_detection=None,on_frame=None,stop_evt=None):
+        on_detection=on_detection or route_to_db
+        self.start()
+        try:
+            while self.is_running() and not (stop_evt and stop_evt.is_set()):
+                for g,annotated,data in self.step():
+                    if on_frame:on_frame(g,annotated)
+                    if data:on_detection(g,annotated,data)
+                self.drain_finished(on_detection)
+            if not (stop_evt and stop_evt.is_set()) and not self.stop_evt.is_set():self.drain_finished(on_detection)
+        finally:self.stop()
+
+# default sink for the multi camera mode: every plate goes through the gate sink with its own gate's role
+def route_to_db(gate,annotated,data):
+    import gate as gate_service
+    print(gate_service.format_event(gate_service.handle_detection(annotated,data,gate["name"],gate["gate_mode"],gate["processed"])))
+
+# pre-builds the exports on a workstation so a kiosk never pays for them at start up
+if __name__=="__main__":
+    import argparse
+    parser=argparse.ArgumentParser(description="Export the detector and OCR models for a CPU inference backend")
+    parser.add_argument("--backend",choices=BACKENDS,default="onnx")
+    parser.add_argument("--precision",choices=PRECISIONS,default="fp32")
+    parser.add_argument("--imgsz",type=int,default=imgsz)
+    parser.add_argument("--ocr",choices=["torch","onnx"],default="onnx")
+    args=parser.parse_args()
+    configure(args.backend,args.precision,args.imgsz,args.ocr)
+    print(f"detector: {export_yolo()}")
+    if args.ocr=="onnx":
+        import easyocr
+        print(f"recognizer: {export_recognizer(easyocr.Reader(['en'],gpu=False,quantize=False))}")
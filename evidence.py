@@ -0,0 +1,74 @@
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime
+import cv2
+import metrics
+EVIDENCE_DIR="captured_plates"
+THUMB_WIDTH=160
+JPEG_QUALITY=85
+THUMB_QUALITY=70
+PAD=0.05 # fraction of the box added on every side so the crop doesn't cut the bumper off
+def thumb_path(path):return path[:-4]+"_thumb.jpg"
+def plate_path(path):return path[:-4]+"_plate.jpg"
+# JPEG encoding and disk writes happen on a background thread, the frame loop only pays for a crop copy
+class EvidenceWriter:
+    def __init__(self,root=EVIDENCE_DIR,maxsize=64):
+        self.root=root
+        self.q=queue.Queue(maxsize)
+        self.thread=None
+        self.lock=threading.Lock()
+        self.written=0
+        self.dropped=0
+        self.failed=0
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread=threading.Thread(target=self._loop,name="evidence-writer",daemon=True)
+                self.thread.start()
+    # reserves a collision free, date sharded path right away so the DB row can point at it before the jpeg lands
+    def submit(self,frame,box,plate_text):
+        now=datetime.now()
+        folder=os.path.join(self.root,now.strftime("%Y"),now.strftime("%m"),now.strftime("%d"))
+        path=os.path.join(folder,f"{plate_text}_{now.strftime('%H%M%S')}_{uuid.uuid4().hex[:8]}.jpg")
+        h,w=frame.shape[:2]
+        if box:
+            x1,y1,x2,y2=box
+            px,py=int((x2-x1)*PAD),int((y2-y1)*PAD)
+            x1,y1,x2,y2=max(x1-px,0),max(y1-py,0),min(x2+px,w),min(y2+py,h)
+        else:x1,y1,x2,y2=0,0,w,h
+        # copies, so the queued job doesn't keep the whole frame alive
+        vehicle=frame[y1:y2,x1:x2].copy()
+        plate=frame[y1+int((y2-y1)*0.25):y2,x1:x2].copy() # same trunk area the OCR read from
+        if vehicle.size==0:return None
+        try:self.q.put_nowait((folder,path,vehicle,plate))
+        except queue.Full:
+            self.dropped+=1 # never stall the gate for an evidence photo
+            metrics.inc("evidence_dropped_total")
+            return None
+        self._ensure_thread()
+        return path
+    def _loop(self):
+        while True:
+            folder,path,vehicle,plate=self.q.get()
+            try:
+                os.makedirs(folder,exist_ok=True)
+                _write_jpeg(path,vehicle,JPEG_QUALITY)
+                if plate.size>0:_write_jpeg(plate_path(path),plate,JPEG_QUALITY)
+                scale=THUMB_WIDTH/vehicle.shape[1]
+                thumb=cv2.resize(vehicle,(THUMB_WIDTH,max(int(vehicle.shape[0]*scale),1)),interpolation=cv2.INTER_AREA) if scale<1 else vehicle
+                _write_jpeg(thumb_path(path),thumb,THUMB_QUALITY)
+                self.written+=1
+            except (OSError,cv2.error):self.failed+=1
+            finally:self.q.task_done()
+    # blocks until everything queued so far is on disk, used before a headless worker exits
+    def flush(self):
+        if self.thread is not None:self.q.join()
+@metrics.timed("image_write_seconds",kind="evidence")
+def _write_jpeg(path,img,quality):
+    ok,buf=cv2.imencode(".jpg",img,[cv2.IMWRITE_JPEG_QUALITY,quality])
+    if not ok:raise OSError(f"could not encode {path}")
+    with open(path,"wb") as f:f.write(buf.tobytes())
+writer=EvidenceWriter()
+def save(frame,box,plate_text):return writer.submit(frame,box,plate_text)
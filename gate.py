@@ -0,0 +1,142 @@
+import argparse
+import functools
+import os
+import re
+import signal
+import threading
+import time
+import cv2
+import database as db
+import evidence
+import metrics
+from plate_index import canonical
+PREVIEW_DIR="live"
+PREVIEW_INTERVAL=0.5 # seconds between preview jpegs for the dashboard
+HEARTBEAT_INTERVAL=2.0
+POSSIBLE_MATCH="Possible watchlist match" # message prefix for fuzzy blacklist hits that were let through
+def preview_path(gate_name):return os.path.join(PREVIEW_DIR,re.sub(r'[^A-Za-z0-9_-]','_',gate_name)+".jpg")
+# shared sink for every gate, in-browser or headless: watchlist check, evidence, handle_vehicle, event log
+def handle_detection(processed_frame,data,gate_name,gate_mode,processed_ids):
+    processed_ids.add(data['track_id'])
+    # only an exact hit, or one that differs by OCR look-alikes alone, blocks the vehicle. On a big watchlist one
+    # real edit matches a fair share of innocent plates, so those are flagged for the guard but still billed
+    hit=db.match_special_plate(data['text'],category='Blacklist')
+    if hit and canonical(hit[0])==canonical(data['text']):
+        listed=f" (listed as {hit[0]})" if hit[0]!=data['text'] else ""
+        ev={"status":"Alert","plate_number":data['text'],"message":f"Reason: {hit[2]}{listed}","fee":None,"duration_min":None,"is_vip":False}
+    else:
+        # encoding and disk write happen on the evidence thread, we only get the reserved path back
+        img_path=evidence.save(processed_frame,data.get('box'),data['text'])
+        status,msg,rec=db.handle_vehicle(data['text'],data['type'],img_path,gate_mode)
+        rec=rec or {}
+        if hit:
+            msg=f"{POSSIBLE_MATCH}: {hit[0]} ({hit[2]}) | {msg}"
+            metrics.inc("watchlist_possible_total")
+        ev={"status":status,"plate_number":data['text'],"message":msg,"fee":rec.get("fee"),"duration_min":rec.get("time"),"is_vip":bool(rec.get("is_vip"))}
+    ev["gate"]=gate_name
+    metrics.inc("gate_events_total",status=ev["status"])
+    ev["id"]=db.log_gate_event(gate_name,ev["status"],ev["plate_number"],ev["message"],ev["fee"],ev["duration_min"],ev["is_vip"])
+    return ev
+def format_event(ev):
+    if ev["status"]=="Alert":return f"[{ev['gate']}] SECURITY ALERT: {ev['plate_number']} | {ev['message']}"
+    if (ev["message"] or "").startswith(POSSIBLE_MATCH):return f"[{ev['gate']}] {ev['status'].upper()} (CHECK): {ev['plate_number']} | {ev['message']}"
+    if ev["status"]=="Exit":return f"[{ev['gate']}] EXIT: {ev['plate_number']} | Fee: ${ev['fee']:.2f} | {ev['duration_min']:.2f} min"
+    return f"[{ev['gate']}] {ev['status'].upper()}: {ev['plate_number']} | {ev['message']}"
+# latest annotated frame for the dashboard, replaced atomically so the reader never sees half a jpeg
+@metrics.timed("image_write_seconds",kind="preview")
+def write_preview(gate_name,frame):
+    path=preview_path(gate_name)
+    ok,buf=cv2.imencode(".jpg",frame,[cv2.IMWRITE_JPEG_QUALITY,70])
+    if not ok:return
+    tmp=path+".tmp"
+    with open(tmp,"wb") as f:f.write(buf.tobytes())
+    os.replace(tmp,path)
+def parse_source(source):return int(source) if str(source).isdigit() else source # "0" means webcam 0, not a file called 0
+def open_source(source):return cv2.VideoCapture(parse_source(source))
+def parse_points(text):return [tuple(float(v) for v in p.split(",")) for p in text.split(";") if p.strip()] # "x1,y1;x2,y2;..."
+# one camera on the threaded capture -> detect pipeline, this thread is the sink
+def run_gate(name,source,gate_mode,stop_evt,metrics_port=None,region=None,scheduler=None):
+    import pipeline
+    import detector as det
+    cap=open_source(source)
+    if not cap.isOpened():raise SystemExit(f"could not open source {source}")
+    processed_ids=set()
+    is_file=os.path.isfile(str(source))
+    detect_fn=functools.partial(det.detect_frame,region=region,scheduler=scheduler)
+    pipe=pipeline.FramePipeline(cap,processed_ids,detect_fn=detect_fn,realtime=is_file).start()
+    last_preview=last_beat=0
+    try:
+        while pipe.is_running() and not stop_evt.is_set():
+            preview,events=pipe.poll(0.1)
+            for processed_frame,data in events:print(format_event(handle_detection(processed_frame,data,name,gate_mode,processed_ids)),flush=True)
+            now=time.time()
+            if preview is not None and now-last_preview>=PREVIEW_INTERVAL:
+                write_preview(name,preview)
+                last_preview=now
+            if now-last_beat>=HEARTBEAT_INTERVAL:
+                db.update_gate_status(name,gate_mode,source,dict(pipe.get_stats(),metrics_port=metrics_port,schedule=scheduler.stats() if scheduler else None))
+                last_beat=now
+    finally:
+        pipe.stop()
+        cap.release()
+        evidence.writer.flush()
+# several cameras through one batched YOLO pass
+def run_gates(gates,stop_evt,metrics_port=None):
+    import detector as det
+    multi=det.MultiGateDetector([(name,parse_source(src),mode,region,scheduler) for name,src,mode,region,scheduler in gates])
+    last={}
+    def on_frame(g,annotated):
+        now=time.time()
+        if now-last.get(g["name"],0)>=PREVIEW_INTERVAL:
+            write_preview(g["name"],annotated)
+            db.update_gate_status(g["name"],g["gate_mode"],g["source"],{"ocr_reads":g["pool"].submitted,"skipped_crops":g["pool"].rejects,"metrics_port":metrics_port,
+                                                                         "schedule":g["scheduler"].stats() if g["scheduler"] else None})
+            last[g["name"]]=now
+    def on_detection(g,annotated,data):print(format_event(handle_detection(annotated,data,g["name"],g["gate_mode"],g["processed"])),flush=True)
+    try:multi.run(on_detection,on_frame,stop_evt)
+    finally:evidence.writer.flush()
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Headless gate worker: runs detection and billing continuously, the dashboard only reads its results")
+    parser.add_argument("--source",action="append",required=True,help="camera index, video file or rtsp:// url (repeat for several gates)")
+    parser.add_argument("--gate",action="append",choices=["Entry","Exit","Auto"],help="gate role per source (default Auto)")
+    parser.add_argument("--name",action="append",help="gate name per source (default Gate-1, Gate-2, ...)")
+    parser.add_argument("--db",default=db.DB_NAME)
+    parser.add_argument("--metrics-port",type=int,help="serve Prometheus metrics on this local port")
+    parser.add_argument("--backend",choices=["torch","onnx","openvino"],help="inference backend (default: from Settings)")
+    parser.add_argument("--precision",choices=["fp32","int8"],help="model precision for onnx/openvino (default: from Settings)")
+    parser.add_argument("--imgsz",type=int,help="detector input size (default: from Settings)")
+    parser.add_argument("--ocr-backend",choices=["torch","onnx"],help="OCR recognizer backend (default: from Settings)")
+    parser.add_argument("--roi",action="append",help='polygon to infer per source, "x1,y1;x2,y2;..." in pixels or 0-1 fractions ("-" = whole frame)')
+    parser.add_argument("--trigger-line",action="append",help='alternative to --roi: only a strip around the line "x1,y1;x2,y2" is inferred')
+    parser.add_argument("--idle-stride",type=int,help="with no motion only every Nth frame is inferred (default 10, 1 = always full rate)")
+    args=parser.parse_args(argv)
+    db.DB_NAME=args.db
+    db.init_db()
+    import detector as det
+    inf=db.get_detector_config()
+    det.configure(args.backend or inf["backend"],args.precision or inf["precision"],args.imgsz or inf["imgsz"],args.ocr_backend or inf["ocr_backend"])
+    det.start_warmup() # loads while the cameras connect, the first vehicle never waits for lazy init
+    if args.metrics_port:metrics.serve(args.metrics_port)
+    os.makedirs(PREVIEW_DIR,exist_ok=True)
+    os.makedirs(evidence.EVIDENCE_DIR,exist_ok=True)
+    modes=args.gate or []
+    names=args.name or []
+    rois=args.roi or []
+    lines=args.trigger_line or []
+    stride=args.idle_stride or det.IDLE_STRIDE
+    def region_for(i):
+        roi=rois[i] if i<len(rois) and rois[i]!="-" else None
+        line=lines[i] if i<len(lines) and lines[i]!="-" else None
+        if roi or line:return det.GateRegion(polygon=parse_points(roi) if roi else None,trigger_line=parse_points(line) if line and not roi else None)
+        return None
+    try:gates=[(names[i] if i<len(names) else f"Gate-{i+1}",src,modes[i] if i<len(modes) else "Auto",region_for(i),det.FrameScheduler(stride)) for i,src in enumerate(args.source)]
+    except ValueError as e:parser.error(f"bad --roi/--trigger-line: {e}")
+    stop_evt=threading.Event()
+    signal.signal(signal.SIGTERM,lambda *_:stop_evt.set())
+    try:
+        if len(gates)==1:
+            name,src,mode,region,scheduler=gates[0]
+            run_gate(name,src,mode,stop_evt,args.metrics_port,region,scheduler)
+        else:run_gates(gates,stop_evt,args.metrics_port)
+    except KeyboardInterrupt:stop_evt.set()
+if __name__=="__main__":main()
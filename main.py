@@ -1,29 +1,82 @@
 import streamlit as st
 import cv2
 import pandas as pd
-import sqlite3
 import time
 import numpy as np
 import os
 import database as db
 import config_manager as cm
 import detector as det
+import pipeline
+import evidence
 import utils
+import gate
+import metrics
+import urllib.request
 import base64
+import tempfile
 st.set_page_config(page_title="High-Performance Parking System",layout="wide")
 # setup our set cache to store tracked ByteTrack IDs during the active session
 if 'processed_tracks' not in st.session_state:st.session_state['processed_tracks']=set()
-os.makedirs("captured_plates",exist_ok=True)
-db.init_db()
+HISTORY_PAGE_SIZE=50
+@st.cache_data(max_entries=1000,show_spinner=False)
 def get_img_as_base64(file_path):
     with open(file_path,"rb") as f:data=f.read()
     return f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+# small thumbnail when the evidence writer made one, full image for captures from before it existed
+def get_evidence_thumb(path):
+    if not path:return None
+    thumb=evidence.thumb_path(path)
+    if os.path.exists(thumb):return get_img_as_base64(thumb)
+    return get_img_as_base64(path) if os.path.exists(path) else None
+# the detector's model globals live for the whole server process, Settings changes are picked up on the next rerun
+def apply_inference_settings():
+    inf=db.get_detector_config()
+    det.configure(inf["backend"],inf["precision"],inf["imgsz"],inf["ocr_backend"])
+    det.start_warmup() # no-op while loading or when already warm
+# once per server process instead of on every rerun, the models load on a background thread so no page waits for torch
+@st.cache_resource
+def startup():
+    os.makedirs(evidence.EVIDENCE_DIR,exist_ok=True)
+    db.init_db()
+    if os.environ.get("PARKING_METRICS_PORT"):metrics.serve(int(os.environ["PARKING_METRICS_PORT"]))
+    apply_inference_settings()
+    return True
+def render_event(box,ev):
+    fmt_time=ev.get("ts") or time.strftime('%H:%M:%S',time.localtime())+f".{int((time.time()%1)*100):02d}"
+    plate=ev["plate_number"]
+    if ev["status"]=="Alert":box.error(f"SECURITY ALERT: Blacklisted Vehicle!\nPlate: {plate} | {ev['message']}")
+    elif (ev["message"] or "").startswith(gate.POSSIBLE_MATCH):box.warning(f"{ev['status'].upper()} - CHECK VEHICLE: {plate}\n{ev['message']}\nTime: {fmt_time}")
+    elif ev["status"]=="Entry":
+        if ev["is_vip"]:box.markdown(f"<div style='background-color:gold;color:black;padding:10px;border-radius:5px;'><b>🌟 VIP ENTRY: {plate}</b></div>",unsafe_allow_html=True)
+        else:box.success(f"ENTRY: {plate}\nTime: {fmt_time}")
+    elif ev["status"]=="Exit":
+        if ev["is_vip"]:box.markdown(f"<div style='background-color:gold;color:black;padding:10px;border-radius:5px;'><b>🌟 VIP EXIT: {plate} | Fee: $0.00</b></div>",unsafe_allow_html=True)
+        else:box.info(f"EXIT: {plate}\nFee: ${ev['fee']:.2f}\nTime: {ev['duration_min']:.2f} min")
+    else:box.error(ev["message"])
 st.sidebar.title("Parking Management")
-page=st.sidebar.radio("Navigate",["Dashboard","Settings","History","Security","Analytics"])
-is_gpu,device_name=utils.check_gpu()
-st.sidebar.success(f"Running on: {device_name}")
+page=st.sidebar.radio("Navigate",["Dashboard","Settings","History","Security","Analytics","Diagnostics"])
+startup()
+model_state=det.model_status()
+# torch is already imported once the models are warm, so asking for the device is free then
+if model_state["state"]=="ready":st.sidebar.success(f"Running on: {utils.check_gpu()[1]}")
+elif model_state["state"]=="error":st.sidebar.error(f"Model loading failed: {model_state['error']}")
+else:st.sidebar.info("Loading detection models...")
 if page=="Dashboard":
     st.title("Real-Time AI Dashboard")
+    apply_inference_settings()
+    # readiness badge, polls while the warm-up runs and reruns the page once the models are in
+    @st.fragment(run_every=1.0 if model_state["state"] in ("idle","loading") else None)
+    def model_badge():
+        status=det.model_status()
+        label=f"{status['backend']}/{status['precision']} @ {status['imgsz']}px"
+        if status["state"]=="ready":
+            if model_state["state"]!="ready":st.rerun()
+            st.caption(f"Models ready ({label}, warm-up {status['seconds']:.1f}s)")
+            if status["fallback"]:st.warning(f"Configured backend failed to load, running on torch instead ({status['fallback']})")
+        elif status["state"]=="error":st.error(f"Models failed to load ({label}): {status['error']}")
+        else:st.info(f"Warming up models ({label})... the first detection will wait for them.")
+    model_badge()
     col1,col2,col3=st.columns(3)
     m1,m2,m3=col1.empty(),col2.empty(),col3.empty()
     sidebar_placeholder=st.sidebar.empty()
@@ -32,14 +85,20 @@ if page=="Dashboard":
         b_in,b_limit=db.get_free_spots('bike')
         m1.metric("Car Spaces Left",f"{c_limit-c_in}",f"{c_in} Occupied",delta_color="inverse")
         m2.metric("Bike Spaces Left",f"{b_limit-b_in}",f"{b_in} Occupied",delta_color="inverse")
-        m3.metric("Today's Revenue",f"${db.get_total_revenue():.2f}")
+        m3.metric("Today's Revenue",f"${db.get_today_revenue():.2f}")
         cm.render_sidebar_status(sidebar_placeholder)
     refresh_metrics()
     st.markdown("---")
     # Multi-Gate Architecture Setup
     c_src,c_gate=st.columns(2)
-    with c_src:source=st.radio("Select Input Source",["Image","Video","Webcam"],horizontal=True)
-    with c_gate:gate_type=st.radio("Gate Role",["Entry Gate","Exit Gate","Auto (Combined)"],horizontal=True)
+    with c_src:source=st.radio("Select Input Source",["Gate Service","Image","Video","Webcam"],horizontal=True)
+    gate_status=db.get_gate_status() if source=="Gate Service" else []
+    with c_gate:
+        if source=="Gate Service":
+            # headless workers own their gate role, the dashboard just picks which one to watch
+            watch=st.selectbox("Gate",[g["gate"] for g in gate_status]) if gate_status else None
+            gate_type=f"{watch} ({next(g['gate_mode'] for g in gate_status if g['gate']==watch)})" if watch else "Gate Service"
+        else:gate_type=st.radio("Gate Role",["Entry Gate","Exit Gate","Auto (Combined)"],horizontal=True)
     gate_mode=gate_type.split()[0] # pulls Entry, Exit, or Auto
     col_video,col_stats=st.columns([0.7,0.3])
     with col_video:
@@ -48,23 +107,41 @@ if page=="Dashboard":
     with col_stats:
         st.subheader("System Activity")
         event_box=st.empty()
+        stats_box=st.empty()
     cap,stop_btn=None,False
-    if source=="Image":
+    if source=="Gate Service":
+        if not gate_status:frame_window.info("No gate worker has reported in yet. Start one with: python -m gate --source 0 --gate Entry --name Main-Entry")
+        else:
+            recent=db.get_gate_events(gate=watch,limit=10)
+            if recent:render_event(event_box,recent[0])
+            stats_box.caption("  \n".join(gate.format_event(ev) for ev in recent[1:]))
+            seen_id=recent[0]["id"] if recent else 0
+            # polls the preview jpeg and the event table, a new event triggers a full rerun for metrics and the event list
+            @st.fragment(run_every=1.0)
+            def live_gate_view():
+                info=next((g for g in db.get_gate_status() if g["gate"]==watch),None)
+                path=gate.preview_path(watch)
+                if os.path.exists(path):st.image(path,use_container_width=True)
+                if info:
+                    age=time.time()-time.mktime(time.strptime(info["heartbeat"],"%Y-%m-%d %H:%M:%S"))
+                    if age>10:st.warning(f"{watch} last reported {age:.0f}s ago, the worker may be down")
+                    else:
+                        sched=info["stats"].get("schedule")
+                        rate=f" | {'idle' if sched['idle'] else 'active'}, {sched['inferred']} inferred / {sched['skipped']} skipped frames" if sched else ""
+                        st.caption(f"{watch} on {info['source']} (pid {info['pid']}, up since {info['started']}){rate}")
+                if db.last_gate_event_id(watch)>seen_id:st.rerun()
+            with col_video:live_gate_view()
+    elif source=="Image":
         up_file=st.file_uploader("Upload Image",type=['jpg','png','jpeg'])
         if up_file:
             file_bytes=np.asarray(bytearray(up_file.read()),dtype=np.uint8)
             frame=cv2.imdecode(file_bytes,1)
-            # pass empty set for single images since tracking isn't continuous here
-            processed_frame,data=det.detect_frame(frame,set())
+            # pass empty set for single images since tracking isn't continuous here, and wait for the OCR pool to finish
+            processed_frame,data=det.detect_frame(frame,set(),wait=True)
             frame_window.image(processed_frame,channels="BGR",use_container_width=True)
             if data:
-                img_path=f"captured_plates/{data['text']}_{int(time.time())}.jpg"
-                cv2.imwrite(img_path,processed_frame)
-                status,msg,rec=db.handle_vehicle(data['text'],data['type'],img_path,gate_mode)
+                render_event(event_box,gate.handle_detection(processed_frame,data,"Dashboard",gate_mode,set()))
                 refresh_metrics()
-                if status=="Entry":event_box.success(f"ENTRY: {data['text']}")
-                elif status=="Exit":event_box.info(f"EXIT: {data['text']}\nFee: ${rec['fee']:.2f}")
-                else:event_box.error(msg)
     elif source=="Video":
         up_video=st.file_uploader("Upload Video",type=['mp4','webm'])
         if up_video:
@@ -77,56 +154,60 @@ if page=="Dashboard":
             cap=cv2.VideoCapture(0)
             stop_btn=st.button("Stop Camera")
     if cap:
-        while cap.isOpened():
-            ret,frame=cap.read()
-            if not ret or stop_btn:break
-            # send our processed_tracks state to detector to skip redundant OCRs
-            processed_frame,data=det.detect_frame(frame,st.session_state['processed_tracks'])
-            frame_window.image(processed_frame,channels="BGR",use_container_width=True)
-            if data:
-                special_info=db.get_special_plate(data['text'])
-                is_blacklisted=special_info and special_info[0]=='Blacklist'
-                if is_blacklisted:
-                    event_box.error(f"SECURITY ALERT: Blacklisted Vehicle!\nPlate: {data['text']} | Reason: {special_info[1]}")
-                    # add to cache so it doesn't spam UI every frame
-                    st.session_state['processed_tracks'].add(data['track_id'])
-                    continue 
-                img_filename=f"captured_plates/{data['text']}_{int(time.time())}.jpg"
-                cv2.imwrite(img_filename,processed_frame)
-                status,msg,rec=db.handle_vehicle(data['text'],data['type'],img_filename,gate_mode)
-                st.session_state['processed_tracks'].add(data['track_id'])
-                refresh_metrics()
-                fmt_time=time.strftime('%H:%M:%S',time.localtime())+f".{int((time.time()%1)*100):02d}"
-                if status=="Entry":
-                    if rec and rec.get("is_vip"):event_box.markdown(f"<div style='background-color:gold;color:black;padding:10px;border-radius:5px;'><b>🌟 VIP ENTRY: {data['text']}</b></div>",unsafe_allow_html=True)
-                    else:event_box.success(f"ENTRY: {data['text']}\nTime: {fmt_time}")
-                elif status=="Exit":
-                    if rec and rec.get("is_vip"):event_box.markdown(f"<div style='background-color:gold;color:black;padding:10px;border-radius:5px;'><b>🌟 VIP EXIT: {data['text']} | Fee: $0.00</b></div>",unsafe_allow_html=True)
-                    else:event_box.info(f"EXIT: {data['text']}\nFee: ${rec['fee']:.2f}\nTime: {rec['time']:.2f} min")
-                else:event_box.error(msg)
-        cap.release()
+        # capture and detection run on their own threads, this script thread is only the sink (UI + persistence)
+        pipe=pipeline.FramePipeline(cap,st.session_state['processed_tracks'],realtime=source=="Video").start()
+        last_stats=0
+        try:
+            while pipe.is_running() and not stop_btn:
+                preview,events=pipe.poll()
+                if preview is not None:frame_window.image(preview,channels="BGR",use_container_width=True)
+                for processed_frame,data in events:
+                    # same sink the headless gate worker uses, it also marks the track as processed
+                    ev=gate.handle_detection(processed_frame,data,"Dashboard",gate_mode,st.session_state['processed_tracks'])
+                    if ev["status"]!="Alert":refresh_metrics()
+                    render_event(event_box,ev)
+                if time.time()-last_stats>1:
+                    rejects=", ".join(f"{k} {v}" for k,v in det.ocr_pool.rejects.items()) or "none"
+                    stats_box.caption(pipe.format_stats()+f"  \nOCR: {det.ocr_pool.submitted} reads | skipped crops: {rejects}")
+                    last_stats=time.time()
+        finally:
+            # streamlit interrupts this thread on rerun, so always shut the worker threads down
+            pipe.stop()
+            cap.release()
 elif page=="Settings":cm.render_config_page()
 elif page=="History":
     st.header("Financial & Parking Logs")
-    conn=sqlite3.connect("parking.db")
-    df_active=pd.read_sql_query("SELECT * FROM active_parking",conn)
-    df_history=pd.read_sql_query("SELECT * FROM transaction_history ORDER BY id DESC",conn)
-    sq=st.text_input("Search License Plate",placeholder="Type plate number...").strip().upper()
-    if sq:
-        df_active=df_active[df_active['plate_number'].str.contains(sq,case=False,na=False)]
-        df_history=df_history[df_history['plate_number'].str.contains(sq,case=False,na=False)]
+    cs,cm_=st.columns([0.7,0.3])
+    with cs:sq=st.text_input("Search License Plate",placeholder="Type plate number...").strip().upper()
+    with cm_:match_mode="prefix" if st.radio("Match",["Starts with","Contains"],horizontal=True)=="Starts with" else "contains"
+    # keyset pagination: a stack of "older than id" cursors, reset whenever the search changes
+    if st.session_state.get('hist_search')!=(sq,match_mode):
+        st.session_state['hist_search']=(sq,match_mode)
+        st.session_state['hist_cursors']=[None]
+    cursors=st.session_state['hist_cursors']
+    rows=db.search_history(sq,match_mode,cursors[-1],HISTORY_PAGE_SIZE+1)
+    has_next=len(rows)>HISTORY_PAGE_SIZE
+    df_history=pd.DataFrame(rows[:HISTORY_PAGE_SIZE],columns=db.HISTORY_COLUMNS)
+    df_active=pd.DataFrame(db.search_active(sq,match_mode),columns=db.ACTIVE_COLUMNS)
+    # images are only encoded for the rows actually on screen
     if not df_active.empty:
-        df_active['entry_time']=pd.to_datetime(df_active['entry_time']).dt.strftime('%Y-%m-%d %H:%M:%S').str[:-3]
-        df_active['evidence_img']=df_active['image_path'].apply(lambda x:get_img_as_base64(x) if x and os.path.exists(x) else None)
+        df_active['entry_time']=df_active['entry_time'].str[:16]
+        df_active['evidence_img']=df_active['image_path'].apply(get_evidence_thumb)
     if not df_history.empty:
-        for col in ['entry_time','exit_time']:df_history[col]=pd.to_datetime(df_history[col]).dt.strftime('%Y-%m-%d %H:%M:%S').str[:-3]
-        df_history['evidence_img']=df_history['image_path'].apply(lambda x:get_img_as_base64(x) if x and os.path.exists(x) else None)
+        for col in ['entry_time','exit_time']:df_history[col]=df_history[col].str[:16]
+        df_history['evidence_img']=df_history['image_path'].apply(get_evidence_thumb)
     cr,cd=st.columns([0.8,0.2])
     with cr:
         if st.button("Refresh History"):st.rerun()
     with cd:
-        if not df_history.empty:
-            st.download_button("Download CSV",df_history.to_csv(index=False).encode('utf-8'),f"parking_report_{time.strftime('%Y%m%d')}.csv","text/csv")
+        if st.button("Prepare CSV"):
+            # a private temp file per export, concurrent sessions never overwrite each other's report
+            with tempfile.NamedTemporaryFile("w",newline="",encoding="utf-8",prefix="parking_report_",suffix=".csv",delete=False) as f:
+                db.export_history_csv(f,sq,match_mode)
+                export_path=f.name
+            try:
+                with open(export_path,"rb") as f:st.download_button("Download CSV",f.read(),f"parking_report_{time.strftime('%Y%m%d')}.csv","text/csv")
+            finally:os.remove(export_path)
     st.subheader("Live Parking Status")
     if df_active.empty and sq:st.warning(f"No active vehicle found for '{sq}'")
     else:st.data_editor(df_active,column_config={"evidence_img":st.column_config.ImageColumn("Evidence"),"image_path":None,"plate_number":"License Plate","vehicle_type":"Type"},use_container_width=True,hide_index=True)
@@ -135,8 +216,11 @@ elif page=="History":
     if df_history.empty and sq:st.warning(f"No history found for '{sq}'")
     elif not df_history.empty:
         st.data_editor(df_history.style.format({"total_fee":"{:.2f}","duration_min":"{:.2f}"}),column_config={"evidence_img":st.column_config.ImageColumn("Entry Photo"),"image_path":None,"plate_number":"License Plate","total_fee":st.column_config.NumberColumn("Fee ($)",format="$%.2f")},use_container_width=True,hide_index=True)
-        st.metric("Total Revenue (Filtered)",f"${df_history['total_fee'].sum():.2f}")
-    conn.close()
+        cp,cpage,cn=st.columns([0.2,0.6,0.2])
+        with cp:st.button("Newer",disabled=len(cursors)==1,on_click=lambda:cursors.pop())
+        with cpage:st.caption(f"Page {len(cursors)}")
+        with cn:st.button("Older",disabled=not has_next,on_click=lambda last=int(df_history['id'].iloc[-1]):cursors.append(last))
+        st.metric("Total Revenue (Filtered)",f"${db.history_revenue(sq,match_mode):.2f}") # whole history when there is no search
 elif page=="Security":
     st.header("Security & VIP Management")
     with st.form("add_special_plate"):
@@ -150,6 +234,17 @@ elif page=="Security":
                 st.success(f"Added {new_plate} as {new_cat}")
                 time.sleep(1)
                 st.rerun()
+    with st.expander("Bulk Import Watchlist (CSV: plate,category,note)"):
+        feed=st.file_uploader("Watchlist CSV",type=['csv'])
+        feed_cat=st.selectbox("Category for rows without one",["Blacklist","VIP"])
+        if feed and st.button("Import"):
+            rows=[]
+            for line in feed.getvalue().decode('utf-8',errors='ignore').splitlines():
+                parts=[p.strip() for p in line.split(',')]
+                if not parts[0] or parts[0].lower()=="plate":continue
+                rows.append((parts[0].upper(),parts[1] if len(parts)>1 and parts[1] in ("VIP","Blacklist") else feed_cat,parts[2] if len(parts)>2 else ""))
+            db.add_special_plates(rows)
+            st.success(f"Imported {len(rows)} plates")
     st.markdown("---")
     st.subheader("Registered Plates")
     plates=db.get_all_special_plates()
@@ -165,29 +260,49 @@ elif page=="Security":
     else:st.info("No special plates registered yet.")
 elif page=="Analytics":
     st.header("Business Intelligence")
-    conn=sqlite3.connect("parking.db")
-    df_history=pd.read_sql_query("SELECT * FROM transaction_history",conn)
-    df_active=pd.read_sql_query("SELECT * FROM active_parking",conn)
-    conn.close()
-    if not df_history.empty or not df_active.empty:
+    # both charts read the hourly/daily rollups maintained by handle_vehicle
+    by_hour=db.traffic_by_hour()
+    by_day=db.revenue_by_weekday()
+    if by_hour:
         c1,c2=st.columns(2)
         with c1:
             st.subheader("Traffic by Hour")
-            e1=df_history[['entry_time']].copy() if not df_history.empty else pd.DataFrame(columns=['entry_time'])
-            e2=df_active[['entry_time']].copy() if not df_active.empty else pd.DataFrame(columns=['entry_time'])
-            all_e=pd.concat([e1,e2])
-            all_e['entry_time']=pd.to_datetime(all_e['entry_time'])
-            all_e['hour']=all_e['entry_time'].dt.hour
-            st.bar_chart(all_e.groupby('hour').size(),color="#FF4B4B")
+            st.bar_chart(pd.DataFrame(by_hour,columns=['hour','entries']).set_index('hour')['entries'],color="#FF4B4B")
         with c2:
             st.subheader("Revenue by Day")
-            if not df_history.empty:
-                df_history['exit_time']=pd.to_datetime(df_history['exit_time'])
-                df_history['day_of_week']=pd.Categorical(df_history['exit_time'].dt.day_name(),categories=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'],ordered=True)
-                st.bar_chart(df_history.groupby('day_of_week')['total_fee'].sum(),color="#00C246")
+            if by_day:
+                df_day=pd.DataFrame(by_day,columns=['day_of_week','total_fee'])
+                df_day['day_of_week']=pd.Categorical(df_day['day_of_week'],categories=['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday'],ordered=True)
+                st.bar_chart(df_day.set_index('day_of_week')['total_fee'],color="#00C246")
             else:st.info("No revenue data available yet.")
     else:st.warning("Not enough data to generate analytics. Process some vehicles first!")
-
+elif page=="Diagnostics":
+    st.header("Pipeline Diagnostics")
+    on=st.toggle("Collect hot-path metrics in this process",value=metrics.enabled())
+    if on!=metrics.enabled():
+        if on:metrics.enable()
+        else:metrics.disable()
+    c1,c2=st.columns([0.8,0.2])
+    with c1:st.caption("Timings and counters since the server started. Headless gate workers export their own metrics with --metrics-port.")
+    with c2:
+        if st.button("Reset"):metrics.reset()
+    snap=metrics.snapshot()
+    if snap["histograms"]:
+        st.subheader("Latency")
+        df_h=pd.DataFrame([dict(name=h["name"],labels=", ".join(f"{k}={v}" for k,v in h["labels"].items()),**{k:h[k] for k in ["count","mean_ms","p50_ms","p95_ms","p99_ms"]}) for h in snap["histograms"]])
+        st.dataframe(df_h.style.format({"mean_ms":"{:.3f}","p50_ms":"{:.3f}","p95_ms":"{:.3f}","p99_ms":"{:.3f}"}),use_container_width=True,hide_index=True)
+    if snap["counters"]:
+        st.subheader("Counters")
+        st.dataframe(pd.DataFrame([{"name":c["name"],"labels":", ".join(f"{k}={v}" for k,v in c["labels"].items()),"value":c["value"]} for c in snap["counters"]]),use_container_width=True,hide_index=True)
+    if not snap["histograms"] and not snap["counters"]:st.info("Nothing recorded yet. Enable collection above and process some frames.")
+    workers=[g for g in db.get_gate_status() if g["stats"].get("metrics_port")]
+    if workers:
+        st.subheader("Gate Workers")
+        sel=st.selectbox("Worker",[g["gate"] for g in workers])
+        port=next(g["stats"]["metrics_port"] for g in workers if g["gate"]==sel)
+        if st.button("Fetch metrics"):
+            try:st.code(urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics",timeout=2).read().decode(),language="text")
+            except OSError as e:st.error(f"Could not reach {sel} on port {port}: {e}")
 
 # end
 # python -m streamlit run main.py 
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+# lightweight hot-path instrumentation: counters and latency histograms, exported as Prometheus text
+# everything is a no-op until enable() is called (or PARKING_METRICS=1 is set), so the disabled cost is one flag check
+BUCKETS=(0.00005,0.0001,0.00025,0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1.0,2.5,5.0) # seconds
+_enabled=False
+_lock=threading.Lock()
+_counters={} # (name,labels) -> value
+_histograms={} # (name,labels) -> [bucket counts..., +Inf count, sum]
+_server=None
+def enable():
+    global _enabled
+    _enabled=True
+def disable():
+    global _enabled
+    _enabled=False
+def enabled():return _enabled
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+def _key(name,labels):return (name,tuple(sorted(labels.items()))) if labels else (name,())
+def inc(name,value=1,**labels):
+    if not _enabled:return
+    key=_key(name,labels)
+    with _lock:_counters[key]=_counters.get(key,0)+value
+def observe(name,seconds,**labels):
+    if not _enabled:return
+    key=_key(name,labels)
+    with _lock:
+        h=_histograms.get(key)
+        if h is None:h=_histograms[key]=[0]*(len(BUCKETS)+2)
+        for i,b in enumerate(BUCKETS):
+            if seconds<=b:
+                h[i]+=1
+                break
+        else:h[len(BUCKETS)]+=1
+        h[-1]+=seconds
+class _Timer:
+    __slots__=("name","labels","t0")
+    def __init__(self,name,labels):self.name,self.labels=name,labels
+    def __enter__(self):
+        self.t0=time.perf_counter()
+        return self
+    def __exit__(self,*exc):observe(self.name,time.perf_counter()-self.t0,**self.labels)
+class _NoopTimer:
+    def __enter__(self):return self
+    def __exit__(self,*exc):return False
+_NOOP=_NoopTimer()
+def timer(name,**labels):return _Timer(name,labels) if _enabled else _NOOP
+def timed(name,**labels):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args,**kwargs):
+            if not _enabled:return fn(*args,**kwargs)
+            t0=time.perf_counter()
+            try:return fn(*args,**kwargs)
+            finally:observe(name,time.perf_counter()-t0,**labels)
+        return wrapper
+    return deco
+# quantile estimate from the bucket counts, linear inside the bucket like Prometheus' histogram_quantile
+def _quantile(h,q):
+    total=sum(h[:-1])
+    if not total:return 0.0
+    rank=q*total
+    seen=0
+    lower=0.0
+    for i,b in enumerate(BUCKETS):
+        if seen+h[i]>=rank:return lower+(b-lower)*((rank-seen)/h[i] if h[i] else 0)
+        seen+=h[i]
+        lower=b
+    return BUCKETS[-1]
+def snapshot():
+    with _lock:
+        counters={k:v for k,v in _counters.items()}
+        hists={k:list(v) for k,v in _histograms.items()}
+    out={"counters":[],"histograms":[]}
+    for (name,labels),v in sorted(counters.items()):out["counters"].append({"name":name,"labels":dict(labels),"value":v})
+    for (name,labels),h in sorted(hists.items()):
+        count=sum(h[:-1])
+        out["histograms"].append({"name":name,"labels":dict(labels),"count":count,"mean_ms":h[-1]/count*1000 if count else 0.0,
+                                  "p50_ms":_quantile(h,0.5)*1000,"p95_ms":_quantile(h,0.95)*1000,"p99_ms":_quantile(h,0.99)*1000})
+    return out
+def _fmt_labels(labels,extra=None):
+    items=list(labels)+(list(extra.items()) if extra else [])
+    return "{"+",".join(f'{k}="{v}"' for k,v in items)+"}" if items else ""
+def render_prometheus():
+    with _lock:
+        counters=sorted(_counters.items())
+        hists=sorted((k,list(v)) for k,v in _histograms.items())
+    lines=[]
+    typed=set()
+    for (name,labels),v in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_fmt_labels(labels)} {v}")
+    for (name,labels),h in hists:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cum=0
+        for i,b in enumerate(BUCKETS):
+            cum+=h[i]
+            lines.append(f"{name}_bucket{_fmt_labels(labels,{'le':b})} {cum}")
+        cum+=h[len(BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels,{'le':'+Inf'})} {cum}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-1]}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cum}")
+    return "\n".join(lines)+"\n"
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics","/"):
+            self.send_error(404)
+            return
+        body=render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type","text/plain; version=0.0.4")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    def log_message(self,*args):pass # scrapes every few seconds would flood the gate log
+# serves /metrics from a daemon thread, also turns collection on; safe to call more than once
+def serve(port,host="127.0.0.1"):
+    global _server
+    enable()
+    if _server is None:
+        _server=ThreadingHTTPServer((host,port),_Handler)
+        threading.Thread(target=_server.serve_forever,name="metrics-http",daemon=True).start()
+    return _server
+if os.environ.get("PARKING_METRICS","")=="1":enable()
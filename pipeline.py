@@ -0,0 +1,128 @@
+import threading
+import queue
+import time
+from collections import deque
+import cv2
+import detector as det
+# bounded queue where the newest frame always wins - when full the oldest item is dropped so latency never piles up
+class LatestQueue:
+    def __init__(self,maxsize=1):
+        self.maxsize=maxsize
+        self.items=deque()
+        self.cond=threading.Condition()
+        self.put_count=0
+        self.dropped=0
+    def put(self,item):
+        with self.cond:
+            if len(self.items)>=self.maxsize:
+                self.items.popleft()
+                self.dropped+=1
+            self.items.append(item)
+            self.put_count+=1
+            self.cond.notify()
+    def get(self,timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda:len(self.items)>0,timeout)
+            return self.items.popleft() if self.items else None
+    def depth(self):
+        with self.cond:return len(self.items)
+# reads a source until it ends or stop_evt is set, file sources paced at their native fps when realtime
+def capture_frames(cap,put,stop_evt,realtime=False):
+    fps=cap.get(cv2.CAP_PROP_FPS) if realtime else 0
+    interval=1.0/fps if fps and fps>0 else 0
+    next_t=time.perf_counter()
+    while not stop_evt.is_set() and cap.isOpened():
+        ret,frame=cap.read()
+        if not ret:break
+        put(frame)
+        if interval:
+            next_t+=interval
+            delay=next_t-time.perf_counter()
+            if delay>0:time.sleep(delay)
+            else:next_t=time.perf_counter()
+# capture -> detect -> sink, each stage on its own thread so a slow OCR call never backs up the camera buffer
+class FramePipeline:
+    def __init__(self,cap,processed_ids,detect_fn=None,frame_depth=1,realtime=False):
+        self.cap=cap
+        self.processed_ids=processed_ids
+        self.detect_fn=detect_fn or det.detect_frame
+        self.realtime=realtime # pace file sources at their native fps instead of reading as fast as disk allows
+        self.frames=LatestQueue(frame_depth)
+        self.previews=LatestQueue(1) # the UI only ever needs the freshest annotated frame
+        self.events=queue.Queue() # plate reads are never dropped, only raw frames are
+        self.stop_evt=threading.Event()
+        self.capture_done=threading.Event()
+        self.detect_done=threading.Event()
+        self.threads=[]
+        self.captured=0
+        self.detected=0
+        self.detect_ms=0.0
+        self.sunk=0
+        self.last_latency_ms=0.0
+        self.max_latency_ms=0.0
+    def start(self):
+        for fn,name in [(self._capture_loop,"capture"),(self._detect_loop,"detect")]:
+            t=threading.Thread(target=fn,name=f"pipeline-{name}",daemon=True)
+            t.start()
+            self.threads.append(t)
+        return self
+    def stop(self,timeout=2.0):
+        self.stop_evt.set()
+        for t in self.threads:t.join(timeout)
+    def is_running(self):
+        # keep going until the detector has drained and every pending event was handed to the sink
+        return not self.stop_evt.is_set() and not (self.detect_done.is_set() and self.events.empty() and self.previews.depth()==0)
+    def _capture_loop(self):
+        def put(frame):
+            self.frames.put((time.perf_counter(),frame))
+            self.captured+=1
+        try:capture_frames(self.cap,put,self.stop_evt,self.realtime)
+        finally:self.capture_done.set()
+    def _detect_loop(self):
+        last_frame=None
+        try:
+            while not self.stop_evt.is_set():
+                item=self.frames.get(timeout=0.1)
+                if item is None:
+                    if self.capture_done.is_set() and self.frames.depth()==0:break
+                    continue
+                ts,frame=item
+                t0=time.perf_counter()
+                processed_frame,data=self.detect_fn(frame,self.processed_ids)
+                self.detect_ms+=(time.perf_counter()-t0)*1000
+                self.detected+=1
+                self.previews.put((ts,processed_frame))
+                if data:self.events.put((ts,processed_frame,data))
+                last_frame=processed_frame
+            # the source ended on its own: the last vehicle's reads may still be in flight or short of agreement
+            if not self.stop_evt.is_set() and last_frame is not None:
+                for data in det.ocr_pool.drain(self.processed_ids):self.events.put((time.perf_counter(),last_frame,data))
+        finally:self.detect_done.set()
+    # called from the sink (the streamlit script thread): returns the newest preview plus every queued event
+    def poll(self,timeout=0.05):
+        preview=self.previews.get(timeout)
+        events=[]
+        while True:
+            try:ts,processed_frame,data=self.events.get_nowait()
+            except queue.Empty:break
+            events.append((processed_frame,data))
+            self._mark_latency(ts)
+        if preview is not None:
+            self._mark_latency(preview[0])
+            preview=preview[1]
+        self.sunk+=len(events)
+        return preview,events
+    def _mark_latency(self,ts):
+        self.last_latency_ms=(time.perf_counter()-ts)*1000
+        self.max_latency_ms=max(self.max_latency_ms,self.last_latency_ms)
+    def get_stats(self):
+        return {
+            "capture":{"frames":self.captured,"queue_depth":self.frames.depth(),"dropped":self.frames.dropped},
+            "detect":{"frames":self.detected,"avg_ms":self.detect_ms/self.detected if self.detected else 0.0,"queue_depth":self.previews.depth(),"dropped":self.previews.dropped},
+            "sink":{"events":self.sunk,"queue_depth":self.events.qsize(),"dropped":0,"latency_ms":self.last_latency_ms,"max_latency_ms":self.max_latency_ms},
+        }
+    def format_stats(self):
+        s=self.get_stats()
+        return (f"Capture: {s['capture']['frames']} frames | depth {s['capture']['queue_depth']} | dropped {s['capture']['dropped']}  \n"
+                f"Detect: {s['detect']['frames']} frames @ {s['detect']['avg_ms']:.0f} ms | dropped previews {s['detect']['dropped']}  \n"
+                f"Sink: {s['sink']['events']} events | depth {s['sink']['queue_depth']} | latency {s['sink']['latency_ms']:.0f} ms (max {s['sink']['max_latency_ms']:.0f})")
@@ -0,0 +1,58 @@
+# in-memory watchlist index: exact lookups plus fuzzy matches that survive an OCR slip or two
+# OCR look-alikes are folded together before matching, so an O/0 or B/8 swap costs nothing
+CONFUSABLE=str.maketrans("OQDIZSBG","00012586")
+def canonical(plate):return plate.upper().translate(CONFUSABLE)
+def edit_distance(a,b,limit=None):
+    if a==b:return 0
+    if limit is not None and abs(len(a)-len(b))>limit:return limit+1
+    prev=list(range(len(b)+1))
+    for i,ca in enumerate(a,1):
+        cur=[i]
+        for j,cb in enumerate(b,1):cur.append(min(prev[j]+1,cur[j-1]+1,prev[j-1]+(ca!=cb)))
+        if limit is not None and min(cur)>limit:return limit+1 # every path is already too far
+        prev=cur
+    return prev[-1]
+# every string reachable by removing up to depth characters (symmetric-delete lookup, far cheaper than a BK-tree walk in python)
+def deletes(word,depth):
+    out={word}
+    frontier={word}
+    for _ in range(depth):
+        frontier={w[:i]+w[i+1:] for w in frontier for i in range(len(w))}
+        out|=frontier
+    return out
+class PlateIndex:
+    def __init__(self,max_dist=1):
+        self.max_dist=max_dist # fixed at build time, the deletion keys are generated for this distance
+        self.entries={} # plate -> (category,note)
+        self.keys={} # deletion variant of a canonical plate -> plates that produce it
+    def __len__(self):return len(self.entries)
+    def add(self,plate,category,note):
+        if plate not in self.entries:
+            for k in deletes(canonical(plate),self.max_dist):self.keys.setdefault(k,set()).add(plate)
+        self.entries[plate]=(category,note)
+    def remove(self,plate):
+        if self.entries.pop(plate,None) is None:return
+        for k in deletes(canonical(plate),self.max_dist):
+            bucket=self.keys.get(k)
+            if bucket is None:continue
+            bucket.discard(plate)
+            if not bucket:del self.keys[k]
+    def get(self,plate):return self.entries.get(plate)
+    # best watchlist hit within max_dist edits as (plate,category,note,distance), exact hits always win
+    def match(self,plate,max_dist=None,category=None):
+        max_dist=self.max_dist if max_dist is None else min(max_dist,self.max_dist)
+        hit=self.entries.get(plate)
+        if hit and (category is None or hit[0]==category):return plate,hit[0],hit[1],0
+        q=canonical(plate)
+        candidates=set()
+        for k in deletes(q,max_dist):candidates|=self.keys.get(k,set())
+        best=None
+        for cand in candidates:
+            entry=self.entries.get(cand)
+            if entry is None:continue # removed by a watchlist update while we were matching
+            cat,note=entry
+            if category is not None and cat!=category:continue
+            if edit_distance(q,canonical(cand),max_dist)>max_dist:continue
+            dist=edit_distance(plate,cand) # rank look-alike slips ahead of genuine character changes
+            if best is None or dist<best[3]:best=(cand,cat,note,dist)
+        return best
@@ -0,0 +1,20 @@
+import gc
+import os
+import sys
+import tempfile
+import threading
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+import database as db
+def setup_module():
+    db.DB_NAME=os.path.join(tempfile.mkdtemp(prefix="parking_test_"),"test.db")
+    db.init_db()
+def teardown_module():db.close_all()
+# every streamlit rerun runs on a fresh thread, their connections must go away with them
+def test_short_lived_threads_release_connections():
+    for _ in range(200):
+        t=threading.Thread(target=db.get_free_spots,args=('car',))
+        t.start()
+        t.join()
+    gc.collect()
+    assert len(db._conns)<=2 # this thread's connection plus at most one not yet collected
+    if os.path.isdir("/proc/self/fd"):assert len(os.listdir("/proc/self/fd"))<50
@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+np=pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+sys.path.insert(0,os.path.join(os.path.dirname(__file__),".."))
+import detector as det
+def _plate_roi(frame,box):
+    x1,y1,x2,y2=box
+    roi=frame[y1+int((y2-y1)*0.25):y2,x1:x2] # same crop process_result reads the plate from
+    return roi,roi[:,:,0].copy()
+# a car taller than the trigger strip is cut at its top and bottom, that must not count as clipped
+def test_box_filling_trigger_strip_is_not_clipped():
+    frame=np.random.default_rng(0).integers(0,255,(720,1280,3),dtype=np.uint8)
+    region=det.GateRegion(trigger_line=[(0.1,0.5),(0.9,0.5)])
+    region.crop(frame)
+    x1,y1,x2,y2=region.rect
+    box=(x1+200,y1,x1+600,y2)
+    roi,gray=_plate_roi(frame,box)
+    assert det.roi_reject_reason(roi,gray,box,region.bounds(),0.0) is None
+# a polygon region still rejects a vehicle cut off at its inner edge
+def test_box_cut_by_polygon_edge_is_clipped():
+    frame=np.random.default_rng(0).integers(0,255,(720,1280,3),dtype=np.uint8)
+    region=det.GateRegion(polygon=[(0.2,0.3),(0.8,0.3),(0.8,0.9),(0.2,0.9)])
+    region.crop(frame)
+    x1,y1,x2,y2=region.rect
+    box=(x1+100,y1,x1+500,y1+200)
+    roi,gray=_plate_roi(frame,box)
+    assert det.roi_reject_reason(roi,gray,box,region.bounds(),0.0)=="clipped"
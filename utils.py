@@ -1,6 +1,9 @@
-import torch
+from functools import lru_cache
+# torch is imported on first call and the answer kept, streamlit reruns and the non-detection pages never pay for it
+@lru_cache(maxsize=None)
 def check_gpu():
+    import torch
     is_gpu=torch.cuda.is_available()
     if is_gpu:device_name=torch.cuda.get_device_name(0)
     else:device_name="CPU"
-    return is_gpu,device_name
\ No newline at end of file
+    return is_gpu,device_name